@@ -0,0 +1,146 @@
+# app.py
+import argparse
+import atexit
+import threading
+import time
+from typing import Any, cast
+
+import bulk
+import service
+from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from flask.typing import ResponseReturnValue
+
+MAX_BATCH_BOARDS = 10000
+
+
+def _options(body: dict[str, Any]) -> tuple[str, float | None]:
+    """The solver and timeout of a request body. Raises ValueError if either is bad."""
+    solver_name = body.get("solver", "dlx")
+    if solver_name not in bulk.SOLVERS:
+        raise ValueError(f"solver must be one of {', '.join(sorted(bulk.SOLVERS))}")
+    timeout = body.get("timeout")
+    if timeout is not None and (type(timeout) not in (int, float) or not timeout > 0):
+        raise ValueError("timeout must be a positive number of seconds")
+    return solver_name, timeout
+
+
+def _outcome_json(outcome: service.Outcome) -> dict[str, Any]:
+    status, solution, elapsed = outcome
+    return {"status": status, "solution": solution, "elapsed": elapsed}
+
+
+def create_app(
+    workers: int | None = None,
+    batch_wait: float = 0.002,
+    max_batch: int = 64,
+    solve_timeout: float = 10.0,
+) -> Flask:
+    """The solve service. `flask run` calls this with the defaults.
+
+    POST /solve takes {"board": ..., "solver": "dlx", "timeout": seconds}, where the
+    board is an 81 character string or a list of rows with 0 or null for empty cells.
+    POST /solve/batch takes {"boards": [...]} with the same options. GET /metrics gives
+    latency histograms, batch sizes and queue depth as JSON.
+    """
+    app = Flask(__name__)
+    # Keep the histogram buckets in order
+    cast(DefaultJSONProvider, app.json).sort_keys = False
+    solver = service.SolveService(workers, batch_wait, max_batch, solve_timeout)
+    atexit.register(solver.close)
+    request_counts = {"solve": 0, "batch": 0, "invalid": 0}
+    lock = threading.Lock()
+
+    def count(kind: str):
+        with lock:
+            request_counts[kind] += 1
+
+    def invalid(message: str) -> ResponseReturnValue:
+        count("invalid")
+        return jsonify({"status": service.INVALID, "error": message}), 400
+
+    @app.post("/solve")
+    def solve() -> ResponseReturnValue:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or "board" not in body:
+            return invalid('expected a JSON object with a "board"')
+        try:
+            solver_name, timeout = _options(body)
+            grid = service.parse_board(body["board"])
+        except ValueError as e:
+            return invalid(str(e))
+        count("solve")
+        outcome = solver.solve(grid, solver_name, timeout)
+        # A puzzle without a solution is still an answer; a timeout is not
+        code = 504 if outcome[0] == service.TIMEOUT else 200
+        return jsonify(_outcome_json(outcome)), code
+
+    @app.post("/solve/batch")
+    def solve_batch() -> ResponseReturnValue:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get("boards"), list):
+            return invalid('expected a JSON object with a list of "boards"')
+        if len(body["boards"]) > MAX_BATCH_BOARDS:
+            return invalid(f"at most {MAX_BATCH_BOARDS} boards per batch")
+        try:
+            solver_name, timeout = _options(body)
+        except ValueError as e:
+            return invalid(str(e))
+        count("batch")
+
+        # Bad boards are reported in place, so one does not fail the whole batch
+        grids: list[service.Grid] = []
+        errors: dict[int, str] = {}
+        for i, data in enumerate(body["boards"]):
+            try:
+                grids.append(service.parse_board(data))
+            except ValueError as e:
+                errors[i] = str(e)
+        outcomes = iter(solver.solve_many(grids, solver_name, timeout))
+        results = [
+            {"status": service.INVALID, "error": errors[i]}
+            if i in errors
+            else _outcome_json(next(outcomes))
+            for i in range(len(body["boards"]))
+        ]
+        return jsonify({"results": results})
+
+    @app.get("/metrics")
+    def metrics() -> ResponseReturnValue:
+        with lock:
+            counts = dict(request_counts)
+        return jsonify({"time": time.time(), "requests": counts, **solver.metrics()})
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the HTTP solve service.")
+    _ = parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    _ = parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+    _ = parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Solver processes (default is one per CPU)",
+    )
+    _ = parser.add_argument(
+        "--batch-wait",
+        type=float,
+        default=0.002,
+        help="Seconds to wait for more boards to join a batch (default 0.002)",
+    )
+    _ = parser.add_argument(
+        "--max-batch", type=int, default=64, help="Most boards sent to a worker at once"
+    )
+    _ = parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Longest a board may be solved for, in seconds (default 10)",
+    )
+    args = parser.parse_args()
+
+    app = create_app(args.workers, args.batch_wait, args.max_batch, args.timeout)
+    app.run(args.host, args.port, threaded=True)
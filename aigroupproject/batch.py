@@ -0,0 +1,164 @@
+# batch.py
+import argparse
+import time
+from collections.abc import Callable
+from functools import cache
+
+import corpus
+import dlx
+import legality
+import numpy as np
+import units
+import utils
+
+
+@cache
+def _unit_matrix(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """0/1 matrix of which cells belong to which unit (rows, then columns, then boxes),
+    and its transpose."""
+    rows, cols, boxes = units.unit_cells(n)
+    size = n * n
+    membership = np.zeros((3 * size, size * size), dtype=np.float32)
+    for u, unit in enumerate(rows + cols + boxes):
+        membership[u, list(unit)] = 1
+    return membership, np.ascontiguousarray(membership.T)
+
+
+def to_array(grids: list[list[list[int]]]) -> np.ndarray:
+    """Stack list[list[int]] boards into a (boards, cells) array, 0 for empty cells."""
+    return np.array(grids, dtype=np.int16).reshape(len(grids), -1)
+
+
+def from_array(values: np.ndarray) -> list[list[list[int]]]:
+    size = int(round(values.shape[1] ** 0.5))
+    return values.reshape(len(values), size, size).tolist()
+
+
+def _candidates(current: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """(boards, cells, digits) mask of the digits still open in every empty cell, and
+    the (boards, units, digits) count of each digit already placed in each unit."""
+    membership, membership_t = _unit_matrix(n)
+    digits = np.arange(1, n * n + 1, dtype=np.int16)
+    placed = (current[:, :, None] == digits).astype(np.float32)
+    unit_placed = membership @ placed
+    # A digit placed in any unit of a cell rules it out for that cell
+    candidates = ((membership_t @ unit_placed) == 0) & (current == 0)[:, :, None]
+    return candidates, unit_placed
+
+
+def propagate(values: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """Fill in naked and hidden singles on every board at once until none are left.
+
+    values is a (boards, cells) array with 0 for empty cells and is not modified.
+    Returns the filled-in values and a mask of the boards that turned out to have no
+    solution. Boards that are neither solved nor dead need a search.
+    """
+    membership, membership_t = _unit_matrix(n)
+    values = values.astype(np.int16, copy=True)
+    dead = np.zeros(len(values), dtype=bool)
+    active = np.arange(len(values))
+
+    while len(active):
+        current = values[active]
+        candidates, unit_placed = _candidates(current, n)
+        counts = candidates.sum(axis=2)
+
+        places = membership @ candidates.astype(np.float32)
+        hidden = (places == 1) & (unit_placed == 0)
+        hidden_cells = ((membership_t @ hidden.astype(np.float32)) > 0) & candidates
+        naked = (counts == 1)[:, :, None] & candidates
+        new = naked | hidden_cells
+
+        contradiction = (
+            (unit_placed > 1).any(axis=(1, 2))
+            | ((current == 0) & (counts == 0)).any(axis=1)
+            | ((places == 0) & (unit_placed == 0)).any(axis=(1, 2))
+            | (new.sum(axis=2) > 1).any(axis=1)
+        )
+        progress = new.any(axis=(1, 2)) & ~contradiction
+
+        fill = new[progress]
+        current = current[progress]
+        cells = fill.any(axis=2)
+        current[cells] = fill.argmax(axis=2)[cells] + 1
+        values[active[progress]] = current
+        dead[active[contradiction]] = True
+        active = active[progress]
+
+    return values, dead
+
+
+def solve_batch(
+    values: np.ndarray,
+    n: int = 3,
+    fallback: Callable[[list[list[int]]], utils.SolveResult] = dlx.solve,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Solve a (boards, cells) array of puzzles.
+
+    Singles are propagated across the whole batch with array operations, and only the
+    boards still unsolved after that go through the scalar fallback solver one at a
+    time. Returns the solutions (all zeros for boards without one) and a solved mask.
+    """
+    values, dead = propagate(values, n)
+    solved = ~dead & (values > 0).all(axis=1)
+    for b in np.flatnonzero(~dead & ~solved):
+        solution = fallback(from_array(values[b : b + 1])[0]).solution
+        if solution is not None:
+            values[b] = np.array(solution, dtype=np.int16).reshape(-1)
+            solved[b] = True
+    values[~solved] = 0
+    return values, solved
+
+
+def benchmark(
+    count: int, seed: int = 0, corpus_path: str | None = None
+) -> tuple[float, float, int]:
+    """Solve the same boards one at a time with dlx.solve and as one batch. The boards
+    come from the corpus file if there is one. Returns the (scalar, batch) boards per
+    second and how many boards the batch left to the fallback."""
+    grids = corpus.load_boards(count, corpus_path, seed)
+    array = to_array(grids)
+
+    start_time = time.perf_counter()
+    scalar = [dlx.solve(grid).solution for grid in grids]
+    scalar_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    solutions, solved = solve_batch(array)
+    batch_time = time.perf_counter() - start_time
+
+    # py-sudoku puzzles are not always unique, so compare legality, not equality
+    assert all(s is not None for s in scalar) and solved.all()
+    assert legality.check_boards(solutions, 3)[0].all()
+    assert (solutions[array > 0] == array[array > 0]).all()
+
+    propagated, dead = propagate(array, 3)
+    fallbacks = int((~dead & (propagated == 0).any(axis=1)).sum())
+    return count / scalar_time, count / batch_time, fallbacks
+
+
+def main(count: int, seed: int, corpus_path: str | None = None):
+    scalar, batched, fallbacks = benchmark(count, seed, corpus_path)
+    print(f"Solved {count} boards, {fallbacks} needed the scalar fallback")
+    print(f"One at a time: {scalar:>10.1f} boards/sec")
+    print(f"Batch:         {batched:>10.1f} boards/sec ({batched / scalar:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the NumPy batch solver against solving boards one by one."
+    )
+    _ = parser.add_argument(
+        "count",
+        nargs="?",
+        type=int,
+        default=1000,
+        help="Number of boards to solve (default is 1000)",
+    )
+    _ = parser.add_argument("--seed", type=int, default=0, help="Puzzle seed")
+    _ = parser.add_argument(
+        "--corpus", default=None, help="Read the boards from this corpus file"
+    )
+    args = parser.parse_args()
+
+    main(count=args.count, seed=args.seed, corpus_path=args.corpus)
@@ -0,0 +1,303 @@
+# benchmark.py
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+import bitboard
+import brute_force as bf
+import bulk
+import dlx
+import legality
+import lookup_table as tbl
+import nxn_sudoku
+import sudoku_solver as solver
+import utils
+
+Solve = Callable[[list[list[int]]], utils.SolveResult]
+
+# Fixed 9x9 puzzle sets, 81 characters each with . for empty cells. Every puzzle has
+# exactly one solution, so the same work is measured on every run.
+EASY = [
+    "39625.1.85.417..93.18..6.4.657.4.381.8..6.45..3.815..29635.7.1....4..92..426895.7",
+    "2457..3.6.7.....91.8.63524.7...5962459682.71.43.1...5..519864.29.4.73..88..4.2.35",
+    ".281934653.92..1...16..83.2..243.57..34.1782....5826..2.3..19.68.5.4621396.32.7..",
+    ".386.91..2.613.9851..24..6.8.1.9253.92436...13...71..948.5.6..3612.8.75459.72..1.",
+    ".6.18.5.97..25..4.5.9.6.8.7..1.38.6.68.49235.2356....484.92.176.7..1.435156.432.8",
+    ".931245.......6.344673..2..5..6.1329671.32.8.9324851763.486.7...8.24..5..2.5139..",
+]
+# Well known puzzles that are hard for people and for heuristic search
+HARD = [
+    "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+    "..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+    "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+    "85...24..72......9..4.........1.7..23.5...9...4...........8..7..17..........36.4.",
+    "12.3....435....1....4........54..2..6...7.........8.9...31..5.......9.7.....6...8",
+    "1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1",
+]
+# 17 givens, the fewest a puzzle with one solution can have
+SEVENTEEN_CLUE = [
+    "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+    "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+    ".......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...",
+    ".......1.4.........2...........5.6.4..8...3....1.9....3..4..2...5.1........8.7...",
+    ".......12....35......6...7.7.....3.....4..8..1...........12.....8.....4..5....6..",
+    ".......12..36..........7...41..2.......5..3..7.....6..28.....4....3..5...........",
+    ".......12..8.3...........4.12.5..........47...6.......5.7...3.....62.......1.....",
+]
+# Worst cases for backtracking that tries cells in order and digits from 1 up. The
+# first is built to defeat it; the rest are hard puzzles with their digits relabelled
+# so that the solution puts 9, 8, 7, ... in the first empty cells.
+ADVERSARIAL = [
+    "..............3.85..1.2.......5.7.....4...1...9.......5......73..2.1........4...9",
+    "1..........54......7..2.8...6...7.......367.....9...5...9....41..16...9..2....3..",
+    "43...12..51......9..2.........7.5..16.3...9...2...........4..5..75..........68.2.",
+    "23.1....417....2....4........74..3..9...6.........5.8...12..7.......8.6.....9...5",
+    "1.......2.4.8...5...3...9...5.4.7.......9.......65..8.9.....3...7...4.6...2.....1",
+]
+
+
+def _generated(n: int, givens: float, count: int) -> list[list[list[int]]]:
+    """Seeded bitboard.puzzle_grid boards, the same on every run."""
+    return [bitboard.puzzle_grid(n, givens, seed) for seed in range(count)]
+
+
+def puzzle_sets() -> dict[str, list[list[list[int]]]]:
+    """Every named puzzle set as grids."""
+    return {
+        "easy": [bulk.parse_puzzle(p) for p in EASY],
+        "hard": [bulk.parse_puzzle(p) for p in HARD],
+        "17-clue": [bulk.parse_puzzle(p) for p in SEVENTEEN_CLUE],
+        "adversarial": [bulk.parse_puzzle(p) for p in ADVERSARIAL],
+        "16x16-easy": _generated(4, 0.55, 8),
+        "16x16": _generated(4, 0.45, 8),
+        "25x25": _generated(5, 0.55, 8),
+    }
+
+
+SET_NAMES = ["easy", "hard", "17-clue", "adversarial", "16x16-easy", "16x16", "25x25"]
+
+
+def _box_size(grid: list[list[int]]) -> int:
+    return math.isqrt(len(grid))
+
+
+BACKENDS: dict[str, Solve] = {
+    "dlx": dlx.solve,
+    "nxn": lambda grid: nxn_sudoku.solve_heuristics_root(grid, _box_size(grid)),
+    "bitboard": lambda grid: bitboard.solve_heuristics_root(grid, _box_size(grid)),
+    "brute_force": bf.brute_force,
+    "lookup_table": tbl.solve_heuristics_root,
+    "templates": tbl.solve_templates,
+    "sudoku_solver": solver.solve_heuristics,
+}
+
+# The sets each backend runs by default. Plain backtracking takes minutes on a 17-clue
+# or adversarial puzzle and seconds on a sparse 16x16 one, bitboard has no propagation
+# to cope with large grids, and lookup_table and templates only handle 9x9.
+DEFAULT_SETS: dict[str, list[str]] = {
+    "dlx": ["easy", "hard", "17-clue", "adversarial", "16x16-easy", "16x16"],
+    "nxn": ["easy", "hard", "17-clue", "adversarial", "16x16-easy", "16x16", "25x25"],
+    "bitboard": ["easy", "hard", "17-clue", "adversarial", "16x16-easy"],
+    "brute_force": ["easy", "hard", "16x16-easy"],
+    "lookup_table": ["easy", "hard", "17-clue", "adversarial"],
+    "templates": ["easy", "hard", "17-clue", "adversarial"],
+    "sudoku_solver": ["easy", "hard", "17-clue", "adversarial", "16x16-easy"],
+}
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Nearest-rank percentile of the samples."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _solves(puzzle: list[list[int]], result: utils.SolveResult) -> bool:
+    """The result is a legal, complete grid that keeps every given."""
+    solution = result.solution
+    return (
+        solution is not None
+        and legality.first_bad_unit(solution) is None
+        and all(
+            given in (0, value)
+            for puzzle_row, row in zip(puzzle, solution, strict=True)
+            for given, value in zip(puzzle_row, row, strict=True)
+        )
+    )
+
+
+def run_set(
+    solve: Solve, puzzles: list[list[list[int]]], warmup: int = 1, repeats: int = 5
+) -> dict[str, float]:
+    """Time every puzzle repeats times after warmup untimed passes.
+
+    Each solve gets a fresh copy of its puzzle, since some solvers fill the board in
+    place. Latencies are per puzzle, over all repeats.
+    """
+    for _ in range(warmup):
+        for puzzle in puzzles:
+            _ = solve([row[:] for row in puzzle])
+
+    latencies: list[float] = []
+    nodes: list[int] = []
+    failures = 0
+    for _ in range(repeats):
+        for puzzle in puzzles:
+            board = [row[:] for row in puzzle]
+            start_time = time.perf_counter()
+            result = solve(board)
+            latencies.append(time.perf_counter() - start_time)
+            nodes.append(result.nodes)
+            if not _solves(puzzle, result):
+                failures += 1
+
+    return {
+        "boards": len(puzzles),
+        "samples": len(latencies),
+        "failures": failures,
+        "median_ms": statistics.median(latencies) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "boards_per_sec": len(latencies) / sum(latencies),
+        "median_nodes": statistics.median(nodes),
+    }
+
+
+def run(
+    backends: list[str] | None = None,
+    sets: list[str] | None = None,
+    warmup: int = 1,
+    repeats: int = 5,
+) -> dict[str, Any]:
+    """Run the backends over the puzzle sets. Each backend runs its default sets, or
+    the ones given that it supports."""
+    all_sets = puzzle_sets()
+    results: list[dict[str, Any]] = []
+    for backend in backends or list(BACKENDS):
+        for set_name in DEFAULT_SETS[backend]:
+            if sets is not None and set_name not in sets:
+                continue
+            stats = run_set(BACKENDS[backend], all_sets[set_name], warmup, repeats)
+            print(
+                f"{backend:<13} {set_name:<12} median {stats['median_ms']:9.3f} ms  "
+                f"p95 {stats['p95_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+                f"{stats['boards_per_sec']:9.1f} boards/sec"
+                + (f"  {stats['failures']} FAILED" if stats["failures"] else ""),
+                flush=True,
+            )
+            results.append({"backend": backend, "set": set_name, **stats})
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "warmup": warmup,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def compare(old: dict[str, Any], new: dict[str, Any], threshold: float) -> int:
+    """Print the change between two result files and return how many backend/set pairs
+    got slower than threshold (0.1 is 10%) in median or p95 latency."""
+
+    old_results = {(r["backend"], r["set"]): r for r in old["results"]}
+    new_results = {(r["backend"], r["set"]): r for r in new["results"]}
+    slower = 0
+    print(
+        f"{'backend':<13} {'set':<12} {'old median':>11} {'new median':>11} "
+        f"{'change':>8} {'p95 change':>11}"
+    )
+    for key in sorted(old_results.keys() | new_results.keys()):
+        if key not in old_results or key not in new_results:
+            where = "old" if key in old_results else "new"
+            print(f"{key[0]:<13} {key[1]:<12} only in the {where} results")
+            continue
+        before, after = old_results[key], new_results[key]
+        median_change = after["median_ms"] / before["median_ms"] - 1
+        p95_change = after["p95_ms"] / before["p95_ms"] - 1
+        flag = ""
+        if median_change > threshold or p95_change > threshold:
+            flag = "  SLOWER"
+            slower += 1
+        elif median_change < -threshold:
+            flag = "  faster"
+        print(
+            f"{key[0]:<13} {key[1]:<12} {before['median_ms']:>9.3f}ms "
+            f"{after['median_ms']:>9.3f}ms {median_change:>+8.1%} {p95_change:>+11.1%}"
+            f"{flag}"
+        )
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the solvers on fixed puzzle sets and compare results."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark")
+    _ = run_parser.add_argument(
+        "-b",
+        "--backends",
+        nargs="+",
+        choices=sorted(BACKENDS),
+        default=None,
+        help="Solvers to run (default is all)",
+    )
+    _ = run_parser.add_argument(
+        "-s",
+        "--sets",
+        nargs="+",
+        choices=SET_NAMES,
+        default=None,
+        help="Puzzle sets to run (default is every set each solver supports)",
+    )
+    _ = run_parser.add_argument(
+        "--warmup", type=int, default=1, help="Untimed passes over each set"
+    )
+    _ = run_parser.add_argument(
+        "--repeats", type=int, default=5, help="Timed passes over each set"
+    )
+    _ = run_parser.add_argument(
+        "-o", "--output", default=None, help="Save the results to this JSON file"
+    )
+
+    compare_parser = commands.add_parser(
+        "compare", help="Flag slowdowns between two result files"
+    )
+    _ = compare_parser.add_argument("old", help="Baseline results")
+    _ = compare_parser.add_argument("new", help="Results to check")
+    _ = compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Slowdown to flag, as a fraction (default is 0.1, 10%%)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.backends, args.sets, args.warmup, args.repeats)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Saved results to {args.output}")
+        return
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    slower = compare(old, new, args.threshold)
+    if slower:
+        print(f"{slower} slower than {args.threshold:.0%}")
+        sys.exit(1)
+    print("No slowdowns.")
+
+
+if __name__ == "__main__":
+    main()
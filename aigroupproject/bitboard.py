@@ -0,0 +1,381 @@
+# bitboard.py
+import argparse
+import random
+import time
+from array import array
+
+import nxn_sudoku
+import search
+import solution_cache
+import units
+import utils
+
+
+def mask_to_values(mask: int) -> list[int]:
+    """Decode a candidate bitmask into the sorted values it contains."""
+    values: list[int] = []
+    while mask:
+        low = mask & -mask
+        values.append(low.bit_length())
+        mask ^= low
+    return values
+
+
+class BitState:
+    """Candidate table with one int bitmask per cell.
+
+    Bit ``v - 1`` of a mask means value ``v`` is possible. Cells are stored flat, so cell
+    ``(row, col)`` lives at ``row * n_squared + col``. The row, column and box masks hold
+    the digits already placed in each unit.
+    """
+
+    cells: array  # per-cell candidate mask
+    values: array  # per-cell placed value, 0 if empty
+    rows: array  # per-row mask of placed digits
+    cols: array  # per-column mask of placed digits
+    boxes: array  # per-box mask of placed digits
+    _is_not_set: set[int]  # flat indices of empty cells
+    # Changes made by constrain, newest last, so they can be undone when backtracking.
+    # (i, delta) means cells[i] was XORed with delta, (i, 0) means cell i was set.
+    _trail: list[tuple[int, int]]
+    verbose: bool = False
+    n: int  # Size of the subgrid
+    n_squared: int  # Size of the full grid (n^2)
+
+    def __init__(self, grid: list[list[int]], n: int, verbose: bool = False) -> None:
+        if n * n > 64:
+            raise ValueError("BitState supports boards up to 64x64")
+        self.verbose = verbose
+        self.n = n
+        self.n_squared = n * n
+        size = self.n_squared * self.n_squared
+        self.cells = array("Q", [(1 << self.n_squared) - 1]) * size
+        self.values = array("H", [0]) * size
+        self.rows = array("Q", [0]) * self.n_squared
+        self.cols = array("Q", [0]) * self.n_squared
+        self.boxes = array("Q", [0]) * self.n_squared
+        self._units = units.cell_units(n)
+        self._peers = units.cell_peers(n)
+        self._is_not_set = set(range(size))
+        self._trail = []
+
+        self.init_table(grid)
+
+    def init_table(self, grid: list[list[int]]):
+        for row in range(self.n_squared):
+            for col in range(self.n_squared):
+                cell = grid[row][col]
+                if cell != 0:
+                    self.constrain(row, col, cell)
+
+    def candidates(self, row: int, col: int) -> int:
+        """Bitmask of the values still possible at (row, col)."""
+        return self.cells[row * self.n_squared + col]
+
+    def is_valid(self, row: int, col: int, num: int) -> bool:
+        i = row * self.n_squared + col
+        return i in self._is_not_set and bool(self.cells[i] >> (num - 1) & 1)
+
+    @utils.RT.hot_path
+    def constrain(self, row: int, col: int, val: int, verbose: bool = False):
+        i = row * self.n_squared + col
+        bit = 1 << (val - 1)
+        cells, trail = self.cells, self._trail
+        for p in self._peers[i]:
+            if cells[p] & bit:
+                cells[p] ^= bit
+                trail.append((p, bit))
+
+        self.rows[row] |= bit
+        self.cols[col] |= bit
+        self.boxes[self._units[i][2]] |= bit
+        if cells[i] != bit:
+            trail.append((i, cells[i] ^ bit))
+            cells[i] = bit
+        self.values[i] = val
+        self._is_not_set.remove(i)
+        trail.append((i, 0))
+
+        if verbose or self.verbose:
+            print(self.format_as_string(row, col))
+
+    def mark(self) -> int:
+        """Current position in the trail, to pass to undo_to later."""
+        return len(self._trail)
+
+    def undo_to(self, mark: int):
+        """Revert every change constrain made since mark was taken."""
+        cells, trail = self.cells, self._trail
+        while len(trail) > mark:
+            i, delta = trail.pop()
+            if delta:
+                cells[i] ^= delta
+            else:
+                r, c, b = self._units[i]
+                clear = ~(1 << (self.values[i] - 1))
+                self.rows[r] &= clear
+                self.cols[c] &= clear
+                self.boxes[b] &= clear
+                self.values[i] = 0
+                self._is_not_set.add(i)
+
+    def constrain_trivial_cells(self) -> bool:
+        did_update = False
+        for i in list(self._is_not_set):
+            mask = self.cells[i]
+            if mask and mask & (mask - 1) == 0:
+                did_update = True
+                r, c, _ = self._units[i]
+                self.constrain(r, c, mask.bit_length())
+        return did_update
+
+    def is_finished(self):
+        return len(self._is_not_set) == 0
+
+    def __str__(self):
+        return self.format_as_string()
+
+    def format_as_string(self, color_row: int = -1, color_col: int = -1) -> str:
+        def format_mask(mask: int, row: int, col: int) -> str:
+            sb = "".join(str(v) for v in mask_to_values(mask))
+            # Ensure consistent spacing for the set output
+            sb = f"{sb[:8]}* " if len(sb) > 9 else f"{sb:9} "
+            if row == color_row and col == color_col:
+                sb = f"\033[31m{sb}\033[0m"  # Color red for the selected cell
+            elif row * self.n_squared + col in self._is_not_set:
+                sb = f"\033[32m{sb}\033[0m"  # Color green for unsolved cells
+            return sb
+
+        table = ""
+        cell_length = 9  # Length for each cell's output
+        horizontal = (
+            (("+-" + "-" * (cell_length + 1) * self.n) + "-") * self.n + "+" + "\n"
+        )
+
+        for r in range(self.n_squared):
+            if r == 0:
+                table += horizontal
+
+            row_str = "| "
+            for c in range(self.n_squared):
+                # Add internal column separators after every n columns
+                if c > 0 and c % self.n == 0:
+                    row_str += " | "
+                row_str += format_mask(self.candidates(r, c), r, c)
+
+            row_str += " |"  # Close the row
+            table += row_str + "\n"
+
+            # Add a separator between subgrids after every n rows
+            if r % self.n == self.n - 1:
+                table += horizontal
+
+        return table
+
+    def to_grid(self) -> list[list[int]]:
+        size = self.n_squared
+        return [list(self.values[r * size : (r + 1) * size]) for r in range(size)]
+
+
+@utils.RT.hot_path
+def most_constrained_variables(state: BitState) -> list[tuple[int, int, int]]:
+    """Empty cells with the fewest candidates, as (row, col, candidate mask)."""
+    tied_cells: list[tuple[int, int, int]] = []
+    min_valid_values = state.n_squared + 1
+
+    cells, units = state.cells, state._units
+    for i in state._is_not_set:
+        mask = cells[i]
+        new_min = mask.bit_count()
+        if new_min == min_valid_values:
+            r, c, _ = units[i]
+            tied_cells.append((r, c, mask))
+        elif new_min < min_valid_values:
+            min_valid_values = new_min
+            r, c, _ = units[i]
+            tied_cells = [(r, c, mask)]
+    return tied_cells
+
+
+@utils.RT.hot_path
+def most_constraining_variable(
+    state: BitState, tied_cells: list[tuple[int, int, int]]
+) -> tuple[int, int, int]:
+    """From a list of tied cells, find the one whose candidates overlap most with the
+    candidates of its empty peers."""
+    max_constraints = -1
+    most_constraining_cell = tied_cells[0]
+
+    cells, unset = state.cells, state._is_not_set
+    for r, c, mask in tied_cells:
+        constraints = 0
+        for p in state._peers[r * state.n_squared + c]:
+            if p in unset:
+                constraints += (cells[p] & mask).bit_count()
+
+        if constraints > max_constraints:
+            max_constraints = constraints
+            most_constraining_cell = (r, c, mask)
+
+    return most_constraining_cell
+
+
+@utils.RT.hot_path
+def least_constraining_values(state: BitState, row: int, col: int) -> list[int]:
+    """Get the possible values of a cell, ordered by how many peers they would remove
+    a candidate from."""
+    i = row * state.n_squared + col
+    assert i in state._is_not_set
+    cells, unset = state.cells, state._is_not_set
+    open_peers = [cells[p] for p in state._peers[i] if p in unset]
+    candidates: list[tuple[int, int]] = []
+    for num in mask_to_values(cells[i]):
+        bit = 1 << (num - 1)
+        candidates.append((num, sum(1 for mask in open_peers if mask & bit)))
+
+    candidates.sort(key=lambda x: x[1])
+    return [x[0] for x in candidates]
+
+
+@solution_cache.cached()
+def solve_heuristics_root(
+    grid: list[list[int]], n: int, verbose: bool = False
+) -> utils.SolveResult:
+    result = utils.SolveResult()
+    start_time = time.perf_counter()
+    state = solve_heuristics(BitState(grid, n, verbose), result)
+    result.elapsed = time.perf_counter() - start_time
+    if state:
+        result.solution = state.to_grid()
+    return result
+
+
+@utils.RT.hot_path
+def expand(
+    state: BitState, result: utils.SolveResult, depth: int
+) -> search.Branch | bool:
+    if state.is_finished():
+        return True
+    while state.constrain_trivial_cells():
+        result.propagations += 1
+        if state.is_finished():
+            return True
+    tied_cells = most_constrained_variables(state)
+    if len(tied_cells) > 1:
+        row, col, _ = most_constraining_variable(state, tied_cells)
+    else:
+        row, col, _ = tied_cells[0]
+    return row, col, least_constraining_values(state, row, col)
+
+
+@utils.RT.hot_path
+def solve_heuristics(state: BitState, result: utils.SolveResult) -> BitState | None:
+    if search.Search(state, expand, result, len(state.cells)).run():
+        return state
+    return None
+
+
+def solution_grid(n: int) -> list[list[int]]:
+    """A fixed, valid, fully solved board for subgrid size n."""
+    n_squared = n * n
+    return [
+        [(n * (r % n) + r // n + c) % n_squared + 1 for c in range(n_squared)]
+        for r in range(n_squared)
+    ]
+
+
+def puzzle_grid(n: int, givens: float, seed: int = 0) -> list[list[int]]:
+    """solution_grid(n) with all but a ``givens`` fraction of the cells blanked out."""
+    rng = random.Random(seed)
+    grid = solution_grid(n)
+    for row in grid:
+        for c in range(len(row)):
+            if rng.random() >= givens:
+                row[c] = 0
+    return grid
+
+
+def _fill_set_state(
+    puzzle: list[list[int]], n: int, solution: list[list[int]]
+) -> nxn_sudoku.State:
+    state = nxn_sudoku.State(puzzle, n)
+    while not state.is_finished():
+        tied_cells = nxn_sudoku.most_constrained_variables(state)
+        r, c, _ = nxn_sudoku.most_constraining_variable(state, tied_cells)
+        _ = nxn_sudoku.least_constraining_values(state, r, c)
+        state.constrain(r, c, solution[r][c])
+    return state
+
+
+def _fill_bit_state(
+    puzzle: list[list[int]], n: int, solution: list[list[int]]
+) -> BitState:
+    state = BitState(puzzle, n)
+    while not state.is_finished():
+        tied_cells = most_constrained_variables(state)
+        r, c, _ = most_constraining_variable(state, tied_cells)
+        _ = least_constraining_values(state, r, c)
+        state.constrain(r, c, solution[r][c])
+    return state
+
+
+def benchmark(n: int, repeats: int = 5, givens: float = 0.4) -> tuple[float, float]:
+    """Time the per-node work of solve_heuristics on both candidate representations.
+
+    Both states load the same seeded puzzle, then repeatedly pick a cell with MRV and
+    the degree tie-break, order its values with LCV and constrain it to the value from
+    the known solution. Returns the best (set based, bitmask based) times in seconds.
+    """
+    solution = solution_grid(n)
+    set_times: list[float] = []
+    bit_times: list[float] = []
+    for seed in range(repeats):
+        puzzle = puzzle_grid(n, givens, seed)
+
+        start_time = time.perf_counter()
+        set_state = _fill_set_state(puzzle, n, solution)
+        set_times.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        bit_state = _fill_bit_state(puzzle, n, solution)
+        bit_times.append(time.perf_counter() - start_time)
+
+        assert set_state.to_grid() == bit_state.to_grid() == solution
+    return min(set_times), min(bit_times)
+
+
+def main(sizes: list[int], repeats: int, givens: float):
+    print(f"{'board':>7} {'set State':>12} {'BitState':>12} {'speedup':>8}")
+    for n in sizes:
+        set_time, bit_time = benchmark(n, repeats, givens)
+        board = f"{n * n}x{n * n}"
+        print(
+            f"{board:>7} {set_time:>11.6f}s {bit_time:>11.6f}s "
+            f"{set_time / bit_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the bitmask candidate table against the set based State."
+    )
+    _ = parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[3, 4, 5],
+        help="Subgrid sizes to benchmark (default is 3 4 5)",
+    )
+    _ = parser.add_argument(
+        "-r", "--repeats", type=int, default=5, help="Runs per size, best is reported"
+    )
+    _ = parser.add_argument(
+        "-g",
+        "--givens",
+        type=float,
+        default=0.4,
+        help="Fraction of cells filled in the benchmark puzzles (default is 0.4)",
+    )
+    args = parser.parse_args()
+
+    main(sizes=args.sizes, repeats=args.repeats, givens=args.givens)
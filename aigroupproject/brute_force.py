@@ -3,34 +3,78 @@ import tests
 import time
 
 import cli
+import solution_cache
 import sudoku_solver as solver
+import utils
 
 
-def brute_force(board: list[list[int]]) -> bool:
+@solution_cache.cached(in_place=True)
+def brute_force(board: list[list[int]]) -> utils.SolveResult:
     """
-    A brute-force backtracking solution to solve Sudoku.
+    A brute-force backtracking solution to solve Sudoku. Fills in board in place. Any
+    n * n by n * n board.
     """
-    for row in range(9):
-        for col in range(9):
-            if board[row][col] == 0:
-                # Try every number from 1 to 9
-                for num in range(1, 10):
-                    if solver.is_valid(board, row, col, num):
-                        board[row][col] = num
-                        # print(f"Placing {num} at ({row},{col})...")
-                        if brute_force(board):
-                            return True
-                        board[row][col] = 0
+    result = utils.SolveResult()
+    start_time = time.perf_counter()
+    size = len(board)
+    # The empty cells in the order they are tried, first to last
+    empty = [
+        (row, col) for row in range(size) for col in range(size) if not board[row][col]
+    ]
+    if _brute_force(solver.Occupancy(board), empty, result):
+        result.solution = board
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+def _brute_force(
+    occupancy: solver.Occupancy, empty: list[tuple[int, int]], result: utils.SolveResult
+) -> bool:
+    """Depth-first search over the empty cells in order, with a loop rather than
+    recursion. Nodes here are too cheap for search.Search to pay off, so the stack is
+    just the candidates each depth has left to try, as masks."""
+    total = len(empty)
+    candidates_of, assign, unassign = (
+        occupancy.candidates,
+        occupancy.assign,
+        occupancy.unassign,
+    )
+    remaining = [0] * total  # Candidates each depth has not tried yet
+    depth = 0
+    result.enter(depth)
+    if not total:
+        return True
+    row, col = empty[0]
+    candidates = candidates_of(row, col)
+    while True:
+        if candidates:
+            # Try every number from 1 up that is not already in the row, column or box
+            low = candidates & -candidates
+            assign(row, col, low.bit_length())
+            remaining[depth] = candidates ^ low
+            depth += 1
+            result.enter(depth)
+            if depth == total:
+                return True
+            row, col = empty[depth]
+            candidates = candidates_of(row, col)
+        else:
+            # Dead end. Back up a cell and take its value out before the next one.
+            depth -= 1
+            if depth < 0:
                 return False
-    return True
+            row, col = empty[depth]
+            unassign(row, col)
+            result.backtracks += 1
+            candidates = remaining[depth]
 
 
 def main(board: list[list[int]]):
     print("Starting brute-force Sudoku solver...")
-    start_time = time.time()
-    if brute_force(board):
-        end_time = time.time()
-        print(f"Brute-force solving time: {end_time - start_time:.6f} seconds.")
+    result = brute_force(board)
+    if result:
+        print(f"Brute-force solving time: {result.elapsed:.6f} seconds.")
+        print(f"Search: {result.format_stats()}")
         print("Solution Found. Testing for accuracy...")
         if tests.is_board_solved(board):
             print("Solution is solved and legal.")
@@ -0,0 +1,241 @@
+# bulk.py
+import argparse
+import math
+import sys
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import TextIO
+
+import brute_force as bf
+import dlx
+import legality
+import nxn_sudoku
+import solution_cache
+import utils
+
+Solve = Callable[[list[list[int]]], utils.SolveResult]
+# Line number of the puzzle in the input, status and the text to write for it
+Result = tuple[int, str, str]
+
+SOLVED = "solved"
+UNSOLVABLE = "unsolvable"
+INVALID = "invalid"
+
+
+def _solve_nxn(grid: list[list[int]]) -> utils.SolveResult:
+    return nxn_sudoku.solve_heuristics_root(grid, math.isqrt(len(grid)))
+
+
+SOLVERS: dict[str, Solve] = {
+    "dlx": dlx.solve,
+    "nxn": _solve_nxn,
+    "brute_force": bf.brute_force,
+}
+
+
+def parse_puzzle(text: str) -> list[list[int]]:
+    """An 81 character puzzle string, row by row, with 0 or . for empty cells."""
+    if len(text) != 81:
+        raise ValueError(f"expected 81 characters, got {len(text)}")
+    values = [0 if ch == "." else int(ch) if ch.isdigit() else -1 for ch in text]
+    if -1 in values:
+        raise ValueError(f"unexpected character {text[values.index(-1)]!r}")
+    return [values[r * 9 : r * 9 + 9] for r in range(9)]
+
+
+def format_grid(grid: list[list[int]]) -> str:
+    return "".join(str(v) for row in grid for v in row)
+
+
+def read_puzzles(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """(line number, puzzle text) for every puzzle line. Blank lines and lines starting
+    with # are skipped."""
+    for number, line in enumerate(lines, start=1):
+        text = line.strip()
+        if text and not text.startswith("#"):
+            yield number, text
+
+
+def _solve_chunk(solver_name: str, chunk: list[tuple[int, str]]) -> list[Result]:
+    solve = SOLVERS[solver_name]
+    results: list[Result] = []
+    for number, text in chunk:
+        try:
+            grid = parse_puzzle(text)
+        except ValueError as e:
+            results.append((number, INVALID, f"invalid: {e}"))
+            continue
+        # Not every solver copes with givens that already clash
+        clash = legality.first_bad_unit(grid, complete=False) is not None
+        solution = None if clash else solve(grid).solution
+        if solution is None:
+            results.append((number, UNSOLVABLE, "no solution"))
+        else:
+            results.append((number, SOLVED, format_grid(solution)))
+    return results
+
+
+def _chunks(
+    puzzles: Iterable[tuple[int, str]], size: int
+) -> Iterator[list[tuple[int, str]]]:
+    it = iter(puzzles)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def solve_stream(
+    puzzles: Iterable[tuple[int, str]],
+    solver_name: str = "dlx",
+    workers: int = 0,
+    ordered: bool = True,
+    chunksize: int = 64,
+    cache_size: int = 0,
+) -> Iterator[Result]:
+    """Solve (line number, puzzle text) pairs lazily, yielding each result as soon as it
+    is ready.
+
+    With no workers everything runs in this process, one chunk at a time. Otherwise
+    chunks go to a process pool with at most four chunks per worker in flight, so
+    memory stays bounded however long the input is. Unordered output yields chunks as
+    they finish instead of waiting for the oldest one. With a cache_size every worker
+    keeps its own solution cache of that size.
+    """
+    chunks = _chunks(puzzles, chunksize)
+    if workers <= 0:
+        for chunk in chunks:
+            yield from _solve_chunk(solver_name, chunk)
+        return
+
+    window = workers * 4
+    initializer = solution_cache.enable if cache_size else None
+    with ProcessPoolExecutor(
+        workers, initializer=initializer, initargs=(cache_size,)
+    ) as executor:
+        in_flight: deque[Future[list[Result]]] = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_solve_chunk, solver_name, chunk))
+            while len(in_flight) >= window:
+                yield from _take_finished(in_flight, ordered)
+        while in_flight:
+            yield from _take_finished(in_flight, ordered)
+
+
+def _take_finished(in_flight: deque[Future[list[Result]]], ordered: bool) -> list[Result]:
+    """Remove and return the results of the oldest chunk, or when unordered of every
+    chunk that has finished (waiting for at least one)."""
+    if ordered:
+        return in_flight.popleft().result()
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    results: list[Result] = []
+    for future in done:
+        in_flight.remove(future)
+        results.extend(future.result())
+    return results
+
+
+def main(
+    source: TextIO,
+    output: TextIO,
+    solver_name: str,
+    workers: int,
+    ordered: bool,
+    chunksize: int,
+    cache_size: int = 0,
+    cache_path: str | None = None,
+):
+    cache = None
+    if cache_size and workers <= 0:
+        cache = solution_cache.enable(cache_size, cache_path)
+    counts = {SOLVED: 0, UNSOLVABLE: 0, INVALID: 0}
+    start_time = time.time()
+    puzzles = read_puzzles(source)
+    for number, status, text in solve_stream(
+        puzzles, solver_name, workers, ordered, chunksize, cache_size
+    ):
+        counts[status] += 1
+        # Out of order lines need the input line number to be matched up
+        print(text if ordered else f"{number}\t{text}", file=output)
+    end_time = time.time()
+
+    total = sum(counts.values())
+    elapsed = end_time - start_time
+    print(
+        f"Solved {counts[SOLVED]}/{total} puzzles in {elapsed:.3f} seconds "
+        f"({total / elapsed:.1f} puzzles/sec), {counts[UNSOLVABLE]} without a "
+        f"solution, {counts[INVALID]} invalid.",
+        file=sys.stderr,
+    )
+    if cache is not None:
+        print(f"Solution cache: {cache.format_stats()}", file=sys.stderr)
+        solution_cache.disable()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Solve a file of 81 character puzzles, one per line."
+    )
+    _ = parser.add_argument(
+        "input",
+        nargs="?",
+        type=argparse.FileType("r"),
+        default=sys.stdin,
+        help="Puzzle file, 0 or . for empty cells (default is stdin)",
+    )
+    _ = parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="Where to write the solutions (default is stdout)",
+    )
+    _ = parser.add_argument(
+        "-s",
+        "--solver",
+        choices=sorted(SOLVERS),
+        default="dlx",
+        help="Solver to use (default is dlx)",
+    )
+    _ = parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes (default is 0, solve in this process)",
+    )
+    _ = parser.add_argument(
+        "-u",
+        "--unordered",
+        action="store_true",
+        help="Write solutions as they finish, prefixed with their input line number",
+    )
+    _ = parser.add_argument(
+        "--chunksize", type=int, default=64, help="Puzzles per worker task"
+    )
+    _ = parser.add_argument(
+        "--cache",
+        type=int,
+        default=0,
+        help="Cache up to this many solutions, shared by equivalent puzzles",
+    )
+    _ = parser.add_argument(
+        "--cache-file",
+        default=None,
+        help="Load the solution cache from this file and save it back at the end",
+    )
+    args = parser.parse_args()
+    if args.cache_file is not None and (not args.cache or args.workers > 0):
+        parser.error("--cache-file needs --cache and solving in this process")
+
+    main(
+        source=args.input,
+        output=args.output,
+        solver_name=args.solver,
+        workers=args.workers,
+        ordered=not args.unordered,
+        chunksize=args.chunksize,
+        cache_size=args.cache,
+        cache_path=args.cache_file,
+    )
@@ -0,0 +1,214 @@
+# canonical.py
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from itertools import groupby, permutations, product
+
+# Columns are kept as an ordered partition while the canonical rows are chosen: a tuple
+# of stack groups, each a tuple of stacks that are still interchangeable, each stack a
+# tuple of column groups, each a tuple of columns that are still interchangeable.
+Stack = tuple[tuple[int, ...], ...]
+Columns = tuple[tuple[Stack, ...], ...]
+
+
+@dataclass(frozen=True)
+class Transform:
+    """A symmetry of the board: optional transposition, then a reordering of the rows
+    and columns that keeps bands and stacks together, then a relabelling of the digits.
+    """
+
+    transpose: bool
+    rows: tuple[int, ...]  # rows[i] is the row moved to row i
+    cols: tuple[int, ...]  # cols[j] is the column moved to column j
+    labels: tuple[int, ...]  # labels[d] is the new digit for digit d, labels[0] == 0
+
+    def apply(self, grid: list[list[int]]) -> list[list[int]]:
+        """The grid with the transform applied."""
+        if self.transpose:
+            grid = [list(col) for col in zip(*grid, strict=True)]
+        labels = self.labels
+        return [[labels[grid[r][c]] for c in self.cols] for r in self.rows]
+
+    def invert(self, grid: list[list[int]]) -> list[list[int]]:
+        """The grid with the transform undone."""
+        digits = [0] * len(self.labels)
+        for digit, label in enumerate(self.labels):
+            digits[label] = digit
+        size = len(grid)
+        result = [[0] * size for _ in range(size)]
+        for i, r in enumerate(self.rows):
+            for j, c in enumerate(self.cols):
+                result[r][c] = digits[grid[i][j]]
+        if self.transpose:
+            result = [list(col) for col in zip(*result, strict=True)]
+        return result
+
+
+@dataclass(frozen=True)
+class _Branch:
+    """One partial transform that still gives the smallest canonical rows so far."""
+
+    grid: list[list[int]]  # Already transposed if transpose is set
+    transpose: bool
+    rows: tuple[int, ...]
+    columns: Columns
+    labels: dict[int, int]
+
+
+def canonical_form(grid: list[list[int]]) -> tuple[tuple[int, ...], Transform]:
+    """The canonical form of a puzzle and the transform that turns the puzzle into it.
+
+    Two puzzles have the same canonical form exactly when one can be turned into the
+    other by transposing, swapping bands or stacks, swapping rows within a band or
+    columns within a stack, and relabelling the digits. The canonical form is the
+    smallest such board read row by row, with empty cells as 0 and the digits
+    relabelled 1, 2, 3, ... in the order they are first read.
+
+    Rows are picked one at a time, keeping every partial transform that gives the
+    smallest row so far. Columns that nothing has told apart yet stay interchangeable,
+    so the search only branches where the order decides which digit is labelled first.
+    """
+    size = len(grid)
+    n = math.isqrt(size)
+    columns: Columns = (tuple((tuple(range(s * n, s * n + n)),) for s in range(n)),)
+    branches = [
+        _Branch(grid, False, (), columns, {}),
+        _Branch([list(col) for col in zip(*grid, strict=True)], True, (), columns, {}),
+    ]
+    canonical: list[int] = []
+    for depth in range(size):
+        # Find the smallest next row first, then only branch on the rows that give it
+        candidates = [
+            (_row_key(branch, r), branch, r)
+            for branch in branches
+            for r in _next_rows(branch.rows, depth, n)
+        ]
+        best = min(key for key, _, _ in candidates)
+        canonical.extend(best)
+        branches = [
+            child
+            for key, branch, r in candidates
+            if key == best
+            for child in _extend(branch, r)
+        ]
+
+    # Any survivor will do, they all give the same board. Columns still tied are
+    # empty in every row, so their order does not matter either.
+    branch = branches[0]
+    cols = tuple(
+        c
+        for group in branch.columns
+        for stack in group
+        for col_group in stack
+        for c in col_group
+    )
+    labels = [0] * (size + 1)
+    unused = iter(sorted(set(range(1, size + 1)) - set(branch.labels.values())))
+    for digit in range(1, size + 1):
+        labels[digit] = branch.labels.get(digit) or next(unused)
+    transform = Transform(branch.transpose, branch.rows, cols, tuple(labels))
+    return tuple(canonical), transform
+
+
+def _next_rows(rows: tuple[int, ...], depth: int, n: int) -> list[int]:
+    """Rows that can go next: any row of an unused band at the start of a band, else
+    the unused rows of the current band."""
+    if depth % n == 0:
+        used_bands = {r // n for r in rows}
+        return [r for r in range(n * n) if r // n not in used_bands]
+    band = rows[-1] // n
+    return [r for r in range(band * n, band * n + n) if r not in rows]
+
+
+def _keys(branch: _Branch, r: int) -> tuple[list[int], int]:
+    """Sort keys for the cells of row r: 0 when empty, the digit's label, or a key
+    after every label for digits not labelled yet, which is also returned."""
+    labels = branch.labels
+    new = len(branch.grid) + 1
+    return [0 if v == 0 else labels.get(v, new) for v in branch.grid[r]], new
+
+
+def _row_key(branch: _Branch, r: int) -> tuple[int, ...]:
+    """Row r in its smallest form under the branch's column order, relabelled."""
+    keys, new = _keys(branch, r)
+    out: list[int] = []
+    for group in branch.columns:
+        stack_keys = sorted(
+            tuple(k for col_group in stack for k in sorted(keys[c] for c in col_group))
+            for stack in group
+        )
+        for stack_key in stack_keys:
+            out.extend(stack_key)
+    label = len(branch.labels)
+    for i, k in enumerate(out):
+        if k == new:
+            label += 1
+            out[i] = label
+    return tuple(out)
+
+
+def _extend(branch: _Branch, r: int) -> Iterator[_Branch]:
+    """The branch with row r added next, once for every column order that puts the row
+    in its smallest form."""
+    row = branch.grid[r]
+    keys, new = _keys(branch, r)
+    options = [_group_options(group, keys, new) for group in branch.columns]
+    for choice in product(*options):
+        columns: Columns = tuple(group for groups in choice for group in groups)
+        labels = dict(branch.labels)
+        for group in columns:
+            for stack in group:
+                for col_group in stack:
+                    for c in col_group:
+                        if keys[c] == new:
+                            labels[row[c]] = len(labels) + 1
+        yield _Branch(branch.grid, branch.transpose, (*branch.rows, r), columns, labels)
+
+
+def _group_options(
+    group: tuple[Stack, ...], keys: list[int], new: int
+) -> list[tuple[tuple[Stack, ...], ...]]:
+    """Ways to order one group of interchangeable stacks, each as the stack groups it
+    splits into."""
+    stacks = sorted(
+        (_stack_options(stack, keys, new) for stack in group),
+        key=lambda options: _stack_keys(options[0], keys),
+    )
+    parts: list[list[tuple[tuple[Stack, ...], ...]]] = []
+    for stack_keys, tied in groupby(stacks, key=lambda o: _stack_keys(o[0], keys)):
+        tied = list(tied)
+        if new not in stack_keys:
+            # No digit to label, the stacks can stay interchangeable
+            parts.append([(tuple(options[0] for options in tied),)])
+            continue
+        # The order of the stacks decides which digit is labelled first, so try each
+        parts.append(
+            [
+                tuple((stack,) for stack in stacks_choice)
+                for order in permutations(tied)
+                for stacks_choice in product(*order)
+            ]
+        )
+    return [tuple(g for part in choice for g in part) for choice in product(*parts)]
+
+
+def _stack_options(stack: Stack, keys: list[int], new: int) -> list[Stack]:
+    """Ways to order one stack's columns by their keys. Columns that are still tied
+    stay together, except unlabelled digits, whose order decides their labels."""
+    pieces: list[list[Stack]] = []
+    for col_group in stack:
+        for key, tied in groupby(
+            sorted(col_group, key=keys.__getitem__), keys.__getitem__
+        ):
+            tied = tuple(tied)
+            if key == new and len(tied) > 1:
+                pieces.append(
+                    [tuple((c,) for c in order) for order in permutations(tied)]
+                )
+            else:
+                pieces.append([(tied,)])
+    return [tuple(g for piece in choice for g in piece) for choice in product(*pieces)]
+
+
+def _stack_keys(stack: Stack, keys: list[int]) -> tuple[int, ...]:
+    return tuple(keys[c] for col_group in stack for c in col_group)
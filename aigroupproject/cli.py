@@ -1,3 +1,6 @@
+import math
+
+import generator
 from sudoku import Sudoku
 
 
@@ -13,7 +16,7 @@ def get_puzzle():
     else:
         # Auto generate a solvable soduku
         difficulty = _get_difficulty()
-        return Sudoku(3).difficulty(difficulty)
+        return Sudoku(3, board=generator.puzzle(difficulty=difficulty))
 
 
 def _get_custom_puzzle() -> list[list[int]]:
@@ -57,9 +60,9 @@ def _get_difficulty():
 
 
 def format_board_ascii(board: list[list[int]]) -> str:
-    width = 3
-    height = 3
-    size = width * height
+    size = len(board)
+    width = math.isqrt(size)
+    height = width
 
     table = ""
     cell_length = len(str(size))
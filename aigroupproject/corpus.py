@@ -0,0 +1,170 @@
+# corpus.py
+import argparse
+import struct
+import time
+from collections.abc import Iterator
+
+import generator
+import numpy as np
+
+# File layout: a 16 byte little-endian header, then one byte per cell, row by row, for
+# every board back to back (81 bytes per 9x9 board). 0 is an empty cell.
+MAGIC = b"SDKC"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxxII")  # magic, version, n, count, seed
+
+
+class Corpus:
+    """A puzzle file opened with a read-only memory map, so boards are only read from
+    disk when they are used."""
+
+    path: str
+    n: int
+    seed: int
+    boards: np.ndarray  # (count, N * N) uint8 memmap
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a puzzle corpus")
+        magic, version, n, count, seed = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} puzzle corpus")
+        self.path = path
+        self.n = n
+        self.seed = seed
+        cells = n**4
+        self.boards = (
+            np.memmap(
+                path, dtype=np.uint8, mode="r", offset=HEADER.size, shape=(count, cells)
+            )
+            if count
+            else np.zeros((0, cells), dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    def __getitem__(self, i: int) -> list[list[int]]:
+        size = self.n * self.n
+        return self.boards[i].reshape(size, size).tolist()
+
+    def __iter__(self) -> Iterator[list[list[int]]]:
+        for chunk in self.chunks():
+            size = self.n * self.n
+            yield from chunk.reshape(len(chunk), size, size).tolist()
+
+    def chunks(self, size: int = 4096) -> Iterator[np.ndarray]:
+        """The boards as (boards, N * N) arrays of up to size boards each."""
+        for start in range(0, len(self.boards), size):
+            yield np.asarray(self.boards[start : start + size])
+
+
+def generate(
+    count: int,
+    n: int = 3,
+    seed: int = 0,
+    min_difficulty: float = 0.0,
+    max_difficulty: float = 1.0,
+    workers: int = 0,
+) -> np.ndarray:
+    """(count, N * N) uint8 array of puzzles with exactly one solution and a difficulty
+    drawn uniformly between min_difficulty and max_difficulty. The same seed gives the
+    same boards."""
+    return generator.generate(
+        count,
+        n,
+        seed,
+        min_difficulty=min_difficulty,
+        max_difficulty=max_difficulty,
+        workers=workers,
+    )
+
+
+def write(path: str, boards: np.ndarray, n: int, seed: int = 0):
+    """Write a (boards, N * N) array as a corpus file."""
+    boards = np.ascontiguousarray(boards, dtype=np.uint8).reshape(len(boards), n**4)
+    with open(path, "wb") as f:
+        _ = f.write(HEADER.pack(MAGIC, VERSION, n, len(boards), seed))
+        _ = f.write(boards.tobytes())
+
+
+def load_boards(
+    count: int, path: str | None = None, seed: int = 0
+) -> list[list[list[int]]]:
+    """The first count boards of a corpus file, or count freshly generated 9x9 boards
+    when there is no file."""
+    if path is None:
+        boards = generate(count, seed=seed)
+        return boards.reshape(count, 9, 9).tolist()
+    corpus = Corpus(path)
+    if count > len(corpus):
+        raise ValueError(f"{path} only has {len(corpus)} boards, {count} requested")
+    size = corpus.n * corpus.n
+    return np.asarray(corpus.boards[:count]).reshape(count, size, size).tolist()
+
+
+def main(
+    path: str,
+    count: int,
+    n: int,
+    seed: int,
+    min_difficulty: float,
+    max_difficulty: float,
+    workers: int = 0,
+):
+    start_time = time.time()
+    boards = generate(count, n, seed, min_difficulty, max_difficulty, workers)
+    write(path, boards, n, seed)
+    end_time = time.time()
+    print(f"Wrote {count} boards to {path} in {end_time - start_time:.3f} seconds.")
+
+    start_time = time.time()
+    corpus = Corpus(path)
+    givens = sum(int(np.count_nonzero(chunk)) for chunk in corpus.chunks())
+    end_time = time.time()
+    print(f"Read them back in {end_time - start_time:.6f} seconds.")
+    print(f"{corpus.n**2}x{corpus.n**2}, {givens / max(count, 1):.1f} givens per board")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a puzzle corpus file for tests and benchmarks."
+    )
+    _ = parser.add_argument("path", help="File to write the boards to")
+    _ = parser.add_argument(
+        "count",
+        nargs="?",
+        type=int,
+        default=10000,
+        help="Number of boards to generate (default is 10000)",
+    )
+    _ = parser.add_argument(
+        "-n", type=int, default=3, help="Subgrid size (default is 3, a 9x9 grid)"
+    )
+    _ = parser.add_argument("--seed", type=int, default=0, help="Puzzle seed")
+    _ = parser.add_argument(
+        "--min-difficulty", type=float, default=0.0, help="Lowest difficulty (0-1)"
+    )
+    _ = parser.add_argument(
+        "--max-difficulty", type=float, default=1.0, help="Highest difficulty (0-1)"
+    )
+    _ = parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=0,
+        help="Worker processes (default is 0, generate in this process)",
+    )
+    args = parser.parse_args()
+
+    main(
+        path=args.path,
+        count=args.count,
+        n=args.n,
+        seed=args.seed,
+        min_difficulty=args.min_difficulty,
+        max_difficulty=args.max_difficulty,
+        workers=args.workers,
+    )
@@ -0,0 +1,282 @@
+# dlx.py
+import math
+import time
+from collections.abc import Iterator
+from functools import cache
+from itertools import islice
+
+import cli
+import solution_cache
+import sudoku_solver as solver
+import tests
+import utils
+
+
+@cache
+def _template(n: int) -> tuple[list[int], ...]:
+    """The full exact-cover matrix of an empty board as Dancing Links arrays.
+
+    Node 0 is the root, nodes 1..4*N^2 are the column headers and every candidate
+    (row, col, val) then gets four nodes, one per constraint it satisfies: its cell,
+    val in its row, val in its column and val in its box. Built once per board size;
+    solves copy the link arrays they modify and share the rest.
+    """
+    size = n * n
+    cells = size * size
+    n_columns = 4 * cells
+
+    left = [n_columns] + list(range(n_columns))
+    right = list(range(1, n_columns + 1)) + [0]
+    up = list(range(n_columns + 1))
+    down = list(range(n_columns + 1))
+    column = list(range(n_columns + 1))
+    counts = [0] * (n_columns + 1)
+    candidate = [-1] * (n_columns + 1)  # (row * size + col) * size + val - 1 per node
+
+    for r in range(size):
+        for c in range(size):
+            b = (r // n) * n + c // n
+            for v in range(size):
+                first = len(left)
+                constraints = (
+                    1 + r * size + c,
+                    1 + cells + r * size + v,
+                    1 + 2 * cells + c * size + v,
+                    1 + 3 * cells + b * size + v,
+                )
+                for k, col in enumerate(constraints):
+                    node = first + k
+                    left.append(first + (k - 1) % 4)
+                    right.append(first + (k + 1) % 4)
+                    # Append to the bottom of the column
+                    up.append(up[col])
+                    down.append(col)
+                    down[up[col]] = node
+                    up[col] = node
+                    column.append(col)
+                    counts[col] += 1
+                    candidate.append((r * size + c) * size + v)
+    return left, right, up, down, column, counts, candidate
+
+
+class ExactCover:
+    """One Dancing Links search over the sudoku exact-cover matrix of size n."""
+
+    n: int
+    size: int  # Size of the full grid (n^2)
+    solution: list[int]  # First node of every chosen candidate row, in order
+    nodes: int  # Candidate rows selected by search
+    backtracks: int  # Selected rows search had to take back
+    max_depth: int
+
+    def __init__(self, n: int) -> None:
+        left, right, up, down, column, counts, candidate = _template(n)
+        self.n = n
+        self.size = n * n
+        self.left = left[:]
+        self.right = right[:]
+        self.up = up[:]
+        self.down = down[:]
+        self.counts = counts[:]
+        self.column = column
+        self.candidate = candidate
+        self.solution = []
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+
+    def cover(self, col: int):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, counts = self.column, self.counts
+        right[left[col]] = right[col]
+        left[right[col]] = left[col]
+        i = down[col]
+        while i != col:
+            j = right[i]
+            while j != i:
+                up[down[j]] = up[j]
+                down[up[j]] = down[j]
+                counts[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, col: int):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, counts = self.column, self.counts
+        i = up[col]
+        while i != col:
+            j = left[i]
+            while j != i:
+                counts[column[j]] += 1
+                up[down[j]] = j
+                down[up[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[col]] = col
+        left[right[col]] = col
+
+    def _row(self, r: int, c: int, v: int) -> int:
+        """First node of the candidate row for v at (r, c)."""
+        size = self.size
+        # Rows of the template are laid out in candidate order, four nodes each
+        return 1 + 4 * size * size + 4 * ((r * size + c) * size + v - 1)
+
+    def place_givens(self, grid: list[list[int]]) -> bool:
+        """Select the candidate rows of the filled cells. False if two givens clash."""
+        size = self.size
+        for r in range(size):
+            for c in range(size):
+                v = grid[r][c]
+                if v == 0:
+                    continue
+                node = self._row(r, c, v)
+                cols = [self.column[node + k] for k in range(4)]
+                # A covered column has been unlinked from its neighbours
+                if any(self.right[self.left[col]] != col for col in cols):
+                    return False
+                for col in cols:
+                    self.cover(col)
+                self.solution.append(node)
+        return True
+
+    def exclude(self, r: int, c: int, v: int):
+        """Rule out v at (r, c) for good by unlinking its row from every column. Call
+        after place_givens and before searching; the row is never put back."""
+        up, down, column, counts = self.up, self.down, self.column, self.counts
+        node = self._row(r, c, v)
+        # Givens may already have taken the row out of some of its columns
+        if any(down[up[j]] != j for j in range(node, node + 4)):
+            return
+        for j in range(node, node + 4):
+            up[down[j]] = up[j]
+            down[up[j]] = down[j]
+            counts[column[j]] -= 1
+
+    def _select(self, node: int):
+        """Cover the other columns of a chosen row."""
+        j = self.right[node]
+        while j != node:
+            self.cover(self.column[j])
+            j = self.right[j]
+
+    def _unselect(self, node: int):
+        j = self.left[node]
+        while j != node:
+            self.uncover(self.column[j])
+            j = self.left[j]
+
+    def solutions(self) -> Iterator[list[int]]:
+        """Algorithm X. Iterative, so boards of any size stay clear of the recursion
+        limit. Yields self.solution every time it holds a complete set of rows, then
+        carries on from there when asked for the next one."""
+        right, down, counts = self.right, self.down, self.counts
+        solution = self.solution
+        chosen: list[int] = []  # Column covered at each search level
+        while True:
+            if right[0] == 0:
+                yield solution
+                # Look for the next solution as if this one had been a dead end
+                col, best = 0, 0
+            else:
+                # Column with the fewest remaining rows (MRV)
+                col = right[0]
+                best = counts[col]
+                j = right[col]
+                while j != 0 and best > 1:
+                    if counts[j] < best:
+                        col, best = j, counts[j]
+                    j = right[j]
+
+            if best > 0:
+                self.cover(col)
+                chosen.append(col)
+                self.max_depth = max(self.max_depth, len(chosen))
+                node = down[col]
+            else:
+                # Dead end. Move the last level on to its next row.
+                if not chosen:
+                    return
+                node = solution.pop()
+                self._unselect(node)
+                self.backtracks += 1
+                node = down[node]
+
+            # Levels that have run out of rows give their column back and step up
+            while node == chosen[-1]:
+                self.uncover(chosen.pop())
+                if not chosen:
+                    return
+                node = solution.pop()
+                self._unselect(node)
+                self.backtracks += 1
+                node = down[node]
+
+            solution.append(node)
+            self._select(node)
+            self.nodes += 1
+
+    def search(self) -> bool:
+        """Find one solution, leaving its rows in self.solution."""
+        return next(self.solutions(), None) is not None
+
+    def count(self, limit: int) -> int:
+        """Number of solutions, counting no further than limit."""
+        return sum(1 for _ in islice(self.solutions(), limit))
+
+    def to_grid(self) -> list[list[int]]:
+        size = self.size
+        grid = [[0] * size for _ in range(size)]
+        for node in self.solution:
+            cell, v = divmod(self.candidate[node], size)
+            r, c = divmod(cell, size)
+            grid[r][c] = v + 1
+        return grid
+
+
+@solution_cache.cached()
+def solve(grid: list[list[int]]) -> utils.SolveResult:
+    """Solve a board of any box size with Dancing Links. The result has no solution if
+    the board has none."""
+    start_time = time.perf_counter()
+    cover = ExactCover(n=math.isqrt(len(grid)))
+    found = cover.place_givens(grid) and cover.search()
+    return utils.SolveResult(
+        solution=cover.to_grid() if found else None,
+        nodes=cover.nodes,
+        backtracks=cover.backtracks,
+        max_depth=cover.max_depth,
+        elapsed=time.perf_counter() - start_time,
+    )
+
+
+def count_solutions(grid: list[list[int]], limit: int = 2) -> int:
+    """Number of solutions of a board of any box size, stopping the search as soon as
+    limit is reached. The default answers whether a puzzle is unique: 0 means no
+    solution (or clashing givens), 1 unique and 2 more than one."""
+    cover = ExactCover(n=math.isqrt(len(grid)))
+    if not cover.place_givens(grid):
+        return 0
+    return cover.count(limit)
+
+
+def main(board: list[list[int]]):
+    result = solve(board)
+    if result.solution:
+        solution = result.solution
+        print(f"DLX solving time: {result.elapsed:.6f} seconds.")
+        print(f"Search: {result.format_stats()}")
+        print("Solution Found. Testing for accuracy...")
+        if tests.is_board_solved(solution):
+            print("Solution is solved and legal.")
+        else:
+            print("Solution is not legal")
+        print(cli.format_board_ascii(solution))
+    else:
+        print("No solution exists.")
+
+
+if __name__ == "__main__":
+    puzzle = cli.get_puzzle()
+    puzzle.show()
+    board = solver.format_board(puzzle.board)
+    main(board)
@@ -0,0 +1,196 @@
+# generator.py
+import argparse
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import canonical
+import dlx
+import numpy as np
+
+Grid = list[list[int]]
+
+
+def solution_grid(n: int, rng: random.Random) -> Grid:
+    """A random complete board with boxes of size n.
+
+    The boxes on the diagonal share no row or column, so each is filled with its own
+    random permutation and Dancing Links completes the rest. A random symmetry of the
+    board (transposition, band, stack, row and column swaps) then mixes it further.
+    """
+    size = n * n
+    while True:
+        grid = [[0] * size for _ in range(size)]
+        for b in range(n):
+            digits = rng.sample(range(1, size + 1), size)
+            for i, v in enumerate(digits):
+                grid[b * n + i // n][b * n + i % n] = v
+        cover = dlx.ExactCover(n)
+        _ = cover.place_givens(grid)
+        # Small boards can get diagonal boxes nothing completes, so draw them again
+        if cover.search():
+            break
+    grid = cover.to_grid()
+
+    bands, stacks = rng.sample(range(n), n), rng.sample(range(n), n)
+    rows = tuple(b * n + r for b in bands for r in rng.sample(range(n), n))
+    cols = tuple(s * n + c for s in stacks for c in rng.sample(range(n), n))
+    labels = (0, *range(1, size + 1))
+    return canonical.Transform(rng.random() < 0.5, rows, cols, labels).apply(grid)
+
+
+def _is_forced(puzzle: Grid, r: int, c: int) -> bool:
+    """Whether the row, column and box of the empty cell (r, c) leave it one digit."""
+    size = len(puzzle)
+    n = math.isqrt(size)
+    box_row, box_col = r - r % n, c - c % n
+    seen = set(puzzle[r])
+    seen.update(row[c] for row in puzzle)
+    for row in puzzle[box_row : box_row + n]:
+        seen.update(row[box_col : box_col + n])
+    seen.discard(0)
+    return len(seen) == size - 1
+
+
+def _has_other_solution(puzzle: Grid, solution: Grid, r: int, c: int) -> bool:
+    """Whether puzzle, which solution solves, has a solution that differs at (r, c).
+
+    Any solution agreeing with solution at (r, c) also solves the puzzle with that
+    cell given, so when that puzzle is unique this is exactly whether emptying (r, c)
+    lost uniqueness. One search with the known value ruled out answers it, which is
+    cheaper than counting to two.
+    """
+    cover = dlx.ExactCover(math.isqrt(len(solution)))
+    _ = cover.place_givens(puzzle)
+    cover.exclude(r, c, solution[r][c])
+    return cover.search()
+
+
+def make_puzzle(solution: Grid, givens: int, rng: random.Random) -> Grid:
+    """Empty cells of a complete board in random order, skipping any whose removal
+    would allow a second solution, until givens are left or no cell can go."""
+    puzzle = [row[:] for row in solution]
+    size = len(solution)
+    cells = [(r, c) for r in range(size) for c in range(size)]
+    rng.shuffle(cells)
+    filled = len(cells)
+    for r, c in cells:
+        if filled <= givens:
+            break
+        puzzle[r][c] = 0
+        # A cell the other givens still force is safe to empty without a search
+        if not _is_forced(puzzle, r, c) and _has_other_solution(puzzle, solution, r, c):
+            puzzle[r][c] = solution[r][c]
+        else:
+            filled -= 1
+    return puzzle
+
+
+def puzzle(
+    n: int = 3,
+    seed: int | str | None = None,
+    givens: int | None = None,
+    difficulty: float = 0.5,
+) -> Grid:
+    """A random puzzle with exactly one solution.
+
+    Without a givens target, difficulty is the fraction of the cells to empty, as
+    with py-sudoku. Puzzles stop getting sparser once every remaining given is needed
+    for uniqueness, so high difficulties give minimal puzzles (about 22 to 26 givens on
+    a 9x9 board). The same seed gives the same puzzle.
+    """
+    rng = random.Random(seed)
+    cells = n**4
+    if givens is None:
+        givens = cells - round(difficulty * cells)
+    return make_puzzle(solution_grid(n, rng), givens, rng)
+
+
+def _generate_range(
+    start: int,
+    stop: int,
+    n: int,
+    seed: int,
+    givens: int | None,
+    min_difficulty: float,
+    max_difficulty: float,
+) -> np.ndarray:
+    boards = np.zeros((stop - start, n**4), dtype=np.uint8)
+    for i in range(start, stop):
+        # Each board has its own seed, so the boards do not depend on how the range
+        # was split between workers
+        rng = random.Random(f"{seed}:{i}")
+        difficulty = rng.uniform(min_difficulty, max_difficulty)
+        grid = puzzle(n, rng.random(), givens, difficulty)
+        boards[i - start] = [v for row in grid for v in row]
+    return boards
+
+
+def generate(
+    count: int,
+    n: int = 3,
+    seed: int = 0,
+    givens: int | None = None,
+    min_difficulty: float = 0.0,
+    max_difficulty: float = 1.0,
+    workers: int = 0,
+    chunksize: int = 256,
+) -> np.ndarray:
+    """(count, N * N) uint8 array of puzzles with exactly one solution, each with the
+    given number of clues or a difficulty drawn uniformly between min_difficulty and
+    max_difficulty. The same seed gives the same boards, with or without workers."""
+    starts = range(0, count, chunksize)
+    stops = [min(s + chunksize, count) for s in starts]
+    args = (n, seed, givens, min_difficulty, max_difficulty)
+    if workers <= 0:
+        parts = [_generate_range(s, e, *args) for s, e in zip(starts, stops, strict=True)]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(_generate_range, s, e, *args)
+                for s, e in zip(starts, stops, strict=True)
+            ]
+            parts = [future.result() for future in futures]
+    return np.concatenate(parts) if parts else np.zeros((0, n**4), dtype=np.uint8)
+
+
+def main(n: int, count: int, seed: int, givens: int | None, difficulty: float):
+    start_time = time.time()
+    boards = generate(count, n, seed, givens, difficulty, difficulty)
+    end_time = time.time()
+    size = n * n
+    for board in boards:
+        # 9x9 boards in the 81 character format bulk.py reads
+        if size == 9:
+            print("".join(str(v) if v else "." for v in board))
+        else:
+            print(" ".join(str(v) for v in board))
+    clues = np.count_nonzero(boards, axis=1)
+    print(
+        f"Generated {count} {size}x{size} puzzles in {end_time - start_time:.3f} "
+        f"seconds, {clues.mean():.1f} givens on average (fewest {clues.min()})."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate puzzles with one solution.")
+    _ = parser.add_argument(
+        "count", nargs="?", type=int, default=1, help="Number of puzzles (default 1)"
+    )
+    _ = parser.add_argument(
+        "-n", type=int, default=3, help="Subgrid size (default is 3, a 9x9 grid)"
+    )
+    _ = parser.add_argument("--seed", type=int, default=0, help="Puzzle seed")
+    _ = parser.add_argument(
+        "--givens", type=int, default=None, help="Target number of givens"
+    )
+    _ = parser.add_argument(
+        "--difficulty",
+        type=float,
+        default=0.5,
+        help="Fraction of the cells to empty, if --givens is not set (default 0.5)",
+    )
+    args = parser.parse_args()
+
+    main(args.n, args.count, args.seed, args.givens, args.difficulty)
@@ -0,0 +1,192 @@
+# legality.py
+import argparse
+import math
+import time
+from functools import cache
+
+import bitboard
+import numpy as np
+import units
+
+
+@cache
+def _all_units(n: int) -> tuple[tuple[int, ...], ...]:
+    """Flat cell indices of every row, column and box, as one tuple of units."""
+    rows, cols, boxes = units.unit_cells(n)
+    return rows + cols + boxes
+
+
+@cache
+def _unit_index(n: int) -> np.ndarray:
+    """_all_units(n) as a (3 * N, N) array."""
+    return np.array(_all_units(n), dtype=np.intp)
+
+
+def describe_unit(unit: int, n: int) -> str:
+    """Human readable name of a unit index, e.g. "row 1" for unit 0."""
+    size = n * n
+    kind, k = divmod(unit, size)
+    return f"{('row', 'column', 'box')[kind]} {k + 1}"
+
+
+def check_boards(
+    boards: np.ndarray, n: int | None = None, complete: bool = True
+) -> tuple[np.ndarray, np.ndarray]:
+    """Check a stack of boards of any size at once.
+
+    boards is a (boards, N, N) or (boards, N * N) array with 0 for empty cells. A board
+    is legal if no unit repeats a digit and every value is between 0 and N. With
+    complete, empty cells make a board fail too.
+
+    Returns a per-board verdict and the first offending unit of each board (rows, then
+    columns, then boxes, numbered as in units.unit_cells), or -1 for boards that pass.
+    """
+    count = len(boards)
+    values = np.asarray(boards).reshape(count, -1)
+    if n is None:
+        n = math.isqrt(math.isqrt(values.shape[1]))
+    size = n * n
+    index = _unit_index(n)
+
+    # Each (board, unit) gets a row of N + 2 bins: empty, the digits 1..N and one for
+    # anything out of range
+    slots = np.where((values >= 0) & (values <= size), values, size + 1)[:, index]
+    base = np.arange(count * 3 * size, dtype=np.intp).reshape(count, 3 * size, 1)
+    bins = np.bincount(
+        (base * (size + 2) + slots).ravel(), minlength=count * 3 * size * (size + 2)
+    ).reshape(count, 3 * size, size + 2)
+
+    bad = (bins[:, :, 1 : size + 1] > 1).any(axis=2) | (bins[:, :, size + 1] > 0)
+    if complete:
+        bad |= bins[:, :, 0] > 0
+    ok = ~bad.any(axis=1)
+    return ok, np.where(ok, -1, bad.argmax(axis=1))
+
+
+def first_bad_unit(board: list[list[int]], complete: bool = True) -> int | None:
+    """check_boards for a single list board, with a bitmask per unit instead of arrays.
+    Returns the first offending unit, or None if the board passes."""
+    size = len(board)
+    n = math.isqrt(size)
+    flat = [v for row in board for v in row]
+    for u, unit in enumerate(_all_units(n)):
+        seen = 0
+        for p in unit:
+            v = flat[p]
+            if v == 0:
+                if complete:
+                    return u
+                continue
+            if not 0 < v <= size or seen >> v & 1:
+                return u
+            seen |= 1 << v
+    return None
+
+
+def _is_board_solved_lists(board: list[list[int]]) -> bool:
+    # The 9x9 list-based check tests.is_board_solved used to do.
+    def is_subgrid_legal(start_row: int, start_col: int):
+        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        for r in range(3):
+            for c in range(3):
+                cell_value = board[r + start_row][c + start_col]
+                if cell_value in digits:
+                    digits.remove(cell_value)
+        return not len(digits)
+
+    for row in board:
+        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        for cell in row:
+            if cell in digits:
+                digits.remove(cell)
+            elif cell != 0:
+                return False
+    for col_idx in range(9):
+        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+        for row in board:
+            cell = row[col_idx]
+            if cell in digits:
+                digits.remove(cell)
+            elif cell != 0:
+                return False
+    for r in range(0, 7, 3):
+        for c in range(0, 7, 3):
+            if not is_subgrid_legal(r, c):
+                return False
+    digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
+    return all(cell in digits for row in board for cell in row)
+
+
+def random_solved_boards(
+    count: int, n: int, broken: float = 0.1, seed: int = 0
+) -> np.ndarray:
+    """(count, N * N) stack of solved boards with their digits relabelled at random. A
+    ``broken`` fraction of them get one cell overwritten so they fail the check."""
+    rng = np.random.default_rng(seed)
+    size = n * n
+    digit_index = np.array(bitboard.solution_grid(n)).reshape(-1) - 1
+    labels = np.argsort(rng.random((count, size)), axis=1) + 1
+    boards = np.take_along_axis(
+        labels, np.broadcast_to(digit_index, (count, size * size)), axis=1
+    )
+    for b in np.flatnonzero(rng.random(count) < broken):
+        cell = rng.integers(size * size)
+        boards[b, cell] = boards[b, cell] % size + 1
+    return boards
+
+
+def benchmark(count: int, n: int = 3) -> dict[str, float]:
+    """Boards per second of the old list check (9x9 only), first_bad_unit one board at
+    a time and check_boards on the whole stack."""
+    boards = random_solved_boards(count, n)
+    grids = boards.reshape(count, n * n, n * n).tolist()
+    expected, _ = check_boards(boards, n)
+
+    results: dict[str, float] = {}
+    checks = {
+        "first_bad_unit": lambda: [first_bad_unit(grid) is None for grid in grids],
+        "check_boards": lambda: check_boards(boards, n)[0].tolist(),
+    }
+    if n == 3:
+        checks = {
+            "lists (old)": lambda: list(map(_is_board_solved_lists, grids))
+        } | checks
+    for name, check in checks.items():
+        start_time = time.perf_counter()
+        verdicts = check()
+        results[name] = count / (time.perf_counter() - start_time)
+        assert verdicts == expected.tolist(), name
+    return results
+
+
+def main(count: int, sizes: list[int]):
+    for n in sizes:
+        print(f"{n * n}x{n * n}, {count} boards:")
+        results = benchmark(count, n)
+        slowest = min(results.values())
+        for name, rate in results.items():
+            print(f"{name:>16}: {rate:>12.0f} boards/sec ({rate / slowest:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the board legality checks against each other."
+    )
+    _ = parser.add_argument(
+        "count",
+        nargs="?",
+        type=int,
+        default=10000,
+        help="Number of boards to check (default is 10000)",
+    )
+    _ = parser.add_argument(
+        "-n",
+        "--sizes",
+        nargs="*",
+        type=int,
+        default=[3, 4],
+        help="Subgrid sizes to check (default is 3 4)",
+    )
+    args = parser.parse_args()
+
+    main(count=args.count, sizes=args.sizes)
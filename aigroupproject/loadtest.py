@@ -0,0 +1,150 @@
+# loadtest.py
+import argparse
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import benchmark
+import generator
+
+
+def post(url: str, body: dict[str, Any]) -> tuple[int, dict[str, Any]]:
+    """POST a JSON body, returning the status code and the decoded JSON reply."""
+    data = json.dumps(body).encode()
+    req = urllib.request.Request(url, data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def run(
+    url: str,
+    boards: list[list[list[int]]],
+    concurrency: int,
+    batch: int,
+    solver_name: str,
+    timeout: float | None,
+) -> tuple[list[float], Counter[str], float]:
+    """Send the boards from concurrency client threads, one per request or batch at a
+    time. Returns the latency of every request in seconds, the count of every board
+    status and the wall time."""
+    if batch > 1:
+        endpoint = url.rstrip("/") + "/solve/batch"
+        bodies = [
+            {"boards": boards[i : i + batch], "solver": solver_name, "timeout": timeout}
+            for i in range(0, len(boards), batch)
+        ]
+    else:
+        endpoint = url.rstrip("/") + "/solve"
+        bodies = [
+            {"board": board, "solver": solver_name, "timeout": timeout}
+            for board in boards
+        ]
+
+    def send(body: dict[str, Any]) -> tuple[float, list[str]]:
+        start_time = time.perf_counter()
+        _, reply = post(endpoint, body)
+        latency = time.perf_counter() - start_time
+        results = reply["results"] if batch > 1 else [reply]
+        return latency, [result["status"] for result in results]
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        replies = list(executor.map(send, bodies))
+    wall = time.perf_counter() - start_time
+    statuses = Counter(
+        status for _, batch_statuses in replies for status in batch_statuses
+    )
+    return [latency for latency, _ in replies], statuses, wall
+
+
+def main(
+    url: str,
+    count: int,
+    concurrency: int,
+    batch: int,
+    solver_name: str,
+    timeout: float | None,
+    difficulty: float,
+    seed: int,
+):
+    boards = generator.generate(
+        count,
+        seed=seed,
+        min_difficulty=difficulty,
+        max_difficulty=difficulty,
+    )
+    grids = boards.reshape(count, 9, 9).tolist()
+    latencies, statuses, wall = run(url, grids, concurrency, batch, solver_name, timeout)
+
+    ms = [latency * 1000 for latency in latencies]
+    print(
+        f"{count} boards in {len(latencies)} requests from {concurrency} clients in "
+        f"{wall:.3f} seconds ({count / wall:.1f} boards/sec)"
+    )
+    p50, p95, p99 = (benchmark.percentile(ms, p) for p in (50, 95, 99))
+    print(
+        f"Request latency ms: p50 {p50:.2f}, p95 {p95:.2f}, p99 {p99:.2f}, "
+        f"max {max(ms):.2f}"
+    )
+    print("Boards: " + ", ".join(f"{n} {status}" for status, n in statuses.items()))
+    with urllib.request.urlopen(url.rstrip("/") + "/metrics") as response:
+        metrics = json.load(response)
+    print(
+        f"Server: queue depth {metrics['queue_depth']}, batch sizes "
+        f"{metrics['batch_size']['count']} batches averaging "
+        f"{metrics['batch_size']['sum'] / max(metrics['batch_size']['count'], 1):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test a running solve service (python app.py or flask run)."
+    )
+    _ = parser.add_argument(
+        "url", nargs="?", default="http://127.0.0.1:5000", help="Service address"
+    )
+    _ = parser.add_argument(
+        "-n", "--count", type=int, default=1000, help="Boards to send (default 1000)"
+    )
+    _ = parser.add_argument(
+        "-c", "--concurrency", type=int, default=16, help="Client threads (default 16)"
+    )
+    _ = parser.add_argument(
+        "-b",
+        "--batch",
+        type=int,
+        default=1,
+        help="Boards per request, above 1 uses /solve/batch (default 1)",
+    )
+    _ = parser.add_argument(
+        "-s", "--solver", default="dlx", help="Solver to ask for (default is dlx)"
+    )
+    _ = parser.add_argument(
+        "--timeout", type=float, default=None, help="Per board solve timeout"
+    )
+    _ = parser.add_argument(
+        "--difficulty",
+        type=float,
+        default=0.6,
+        help="Fraction of the cells to empty (default 0.6)",
+    )
+    _ = parser.add_argument("--seed", type=int, default=0, help="Puzzle seed")
+    args = parser.parse_args()
+
+    main(
+        url=args.url,
+        count=args.count,
+        concurrency=args.concurrency,
+        batch=args.batch,
+        solver_name=args.solver,
+        timeout=args.timeout,
+        difficulty=args.difficulty,
+        seed=args.seed,
+    )
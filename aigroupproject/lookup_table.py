@@ -1,38 +1,59 @@
 # lookup_table.py
-import random
+import os
 import time
+from contextlib import suppress
 from copy import deepcopy
+from functools import cache
 from typing import override
 
 import cli
+import corpus
+import numpy as np
+import search
+import solution_cache
 import sudoku_solver as solver
 import tests
+import units
 import utils
-from sudoku import Sudoku
+
+PEERS = units.cell_peers(3)
+CELL_UNITS = units.cell_units(3)
 
 
 class State:
     table: list[list[set[int]]]
-    is_set: set[tuple[int, int]]
-    is_not_set: set[tuple[int, int]]
+    cells: list[set[int]]  # The sets of table, flat, indexed by row * 9 + col
+    is_set: set[int]  # Flat indices of set cells
+    is_not_set: set[int]  # Flat indices of unset cells
+    # Changes made by constrain, newest last, so they can be undone when backtracking.
+    # (i, val) means val was removed from cell i, (i, -val) means it was added, and
+    # (i, 0) means the cell was marked as set.
+    trail: list[tuple[int, int]]
+    # Unset cells bucketed by how many candidates they have left, so the most
+    # constrained cells are always in the first non-empty bucket.
+    buckets: list[set[int]]
     verbose: bool = False
 
     def __init__(self, grid: list[list[int]], verbose: bool = False) -> None:
         self.table = []
         self.is_set = set()
-        self.is_not_set = set()
+        self.trail = []
         self.verbose = verbose
-        for r in range(9):
+        for _ in range(9):
             row: list[set[int]] = []
-            for c in range(9):
+            for _ in range(9):
                 row.append(set(range(1, 10)))
-                self.is_not_set.add((r, c))
             self.table.append(row)
+        self.cells = [cell for row in self.table for cell in row]
+        self.is_not_set = set(range(81))
+        self.buckets = [set() for _ in range(10)]
+        self.buckets[9] = set(self.is_not_set)
 
         self.init_table(grid)
 
     def is_valid(self, row: int, col: int, num: int) -> bool:
-        return (row, col) in self.is_not_set and num in self.table[row][col]
+        i = row * 9 + col
+        return i in self.is_not_set and num in self.cells[i]
 
     def init_table(self, grid: list[list[int]]):
         for row in range(9):
@@ -41,34 +62,79 @@ class State:
                 if cell != 0:
                     self.constrain(row, col, cell)
 
+    @utils.RT.hot_path
     def constrain(self, row: int, col: int, val: int, verbose: bool = False):
-        for i in range(9):
-            self.table[row][i].discard(val)
-            self.table[i][col].discard(val)
-
-        start_row, start_col = row - row % 3, col - col % 3
-        for i in range(3):
-            for j in range(3):
-                self.table[i + start_row][j + start_col].discard(val)
-        self.table[row][col] = set([val])
-        self.is_set.add((row, col))
-        self.is_not_set.remove((row, col))
+        i = row * 9 + col
+        cells, trail = self.cells, self.trail
+        for p in PEERS[i]:
+            if val in cells[p]:
+                self._remove(p, val)
+                trail.append((p, val))
+
+        # Mark the cell as set before narrowing it down, so it leaves the buckets first
+        cell = cells[i]
+        self.buckets[len(cell)].remove(i)
+        self.is_set.add(i)
+        self.is_not_set.remove(i)
+        trail.append((i, 0))
+        for other in [v for v in cell if v != val]:
+            cell.remove(other)
+            trail.append((i, other))
+        if val not in cell:
+            cell.add(val)
+            trail.append((i, -val))
         if verbose or self.verbose:
             print(self.format_as_string(row, col))
 
-    def constrain_trivial_cells(self) -> bool:
+    def _remove(self, i: int, val: int):
+        cell = self.cells[i]
+        cell.remove(val)
+        if i in self.is_not_set:
+            self.buckets[len(cell) + 1].remove(i)
+            self.buckets[len(cell)].add(i)
+
+    def _add(self, i: int, val: int):
+        cell = self.cells[i]
+        cell.add(val)
+        if i in self.is_not_set:
+            self.buckets[len(cell) - 1].remove(i)
+            self.buckets[len(cell)].add(i)
+
+    def mark(self) -> int:
+        """Current position in the trail, to pass to undo_to later."""
+        return len(self.trail)
+
+    def undo_to(self, mark: int):
+        """Revert every change constrain made since mark was taken."""
+        trail = self.trail
+        while len(trail) > mark:
+            i, val = trail.pop()
+            if val > 0:
+                self._add(i, val)
+            elif val < 0:
+                self._remove(i, -val)
+            else:
+                self.is_set.remove(i)
+                self.is_not_set.add(i)
+                self.buckets[len(self.cells[i])].add(i)
+
+    def constrain_trivial_cells(
+        self, trace: utils.Trace | None = None, depth: int = 0
+    ) -> bool:
         did_update = False
         to_update = deepcopy(self.is_not_set)
-        for r, c in to_update:
-            if len(self.table[r][c]) == 1:
-                to_update.add((r, c))
+        for i in to_update:
+            if len(self.cells[i]) == 1:
                 did_update = True
-                val = next(iter(self.table[r][c]))
+                r, c, _ = CELL_UNITS[i]
+                val = next(iter(self.cells[i]))
                 self.constrain(r, c, val)
+                if trace is not None:
+                    trace.propagate(depth, r, c, val)
         return did_update
 
     def is_finished(self):
-        return all(len(self.table[r][c]) <= 1 for r, c in self.is_not_set)
+        return len(self.is_not_set) == 0
 
     @override
     def __str__(self):
@@ -113,25 +179,19 @@ class State:
         return grid
 
 
+@utils.RT.hot_path
 def most_constrained_variables(
     state: State,
 ) -> list[tuple[int, int, set[int]]]:
-    tied_cells: list[tuple[int, int, set[int]]] = []
-    min_valid_values = 10  # Start with a value larger than the max (9)
-
-    for r, c in state.is_not_set:
-        possible_values = state.table[r][c]
-        new_min = len(possible_values)
-        if new_min == min_valid_values:
-            # ties are allowed, if two cells are equally constrained
-            tied_cells.append((r, c, possible_values))
-        elif new_min < min_valid_values:
-            min_valid_values = new_min
-            # remove old cells, since this cell is more constrained.
-            tied_cells = [(r, c, possible_values)]
-    return tied_cells
+    # constrain and undo_to keep the buckets current, so the most constrained cells are
+    # the first non-empty bucket. ties are allowed, if two cells are equally constrained
+    for bucket in state.buckets:
+        if bucket:
+            return [(*CELL_UNITS[i][:2], state.cells[i]) for i in bucket]
+    return []
 
 
+@utils.RT.hot_path
 def most_constraining_variable(
     state: State, tied_cells: list[tuple[int, int, set[int]]]
 ) -> tuple[int, int, set[int]]:
@@ -140,25 +200,14 @@ def most_constraining_variable(
     max_constraints = -1
     most_constraining_cell = tied_cells[0]
 
+    cells, unset = state.cells, state.is_not_set
     for r, c, s in tied_cells:
+        # counting the candidates it shares with unassigned cells in its row, column
+        # and subgrid
         constraints = 0
-        possible_values: set[int] = state.table[r][c]
-
-        # counting unassigned cells in the same row and column
-        for i in range(9):
-            for v in possible_values:
-                if state.is_valid(r, i, v):
-                    constraints += 1
-                if state.is_valid(i, c, v):
-                    constraints += 1
-
-        # counting unassigned cells in the subgrid
-        start_row, start_col = 3 * (r // 3), 3 * (c // 3)
-        for i in range(start_row, start_row + 3):
-            for j in range(start_col, start_col + 3):
-                for v in possible_values:
-                    if state.is_valid(i, j, v):
-                        constraints += 1
+        for p in PEERS[r * 9 + c]:
+            if p in unset:
+                constraints += len(cells[p] & s)
 
         # updating the most constraining variable
         if constraints > max_constraints:
@@ -168,32 +217,17 @@ def most_constraining_variable(
     return most_constraining_cell
 
 
+@utils.RT.hot_path
 def least_constraining_values(state: State, row: int, col: int) -> list[int]:
     """Get the possible values of a cell, ordered by their least constraining effect"""
-    assert (row, col) not in state.is_set
+    i = row * 9 + col
+    assert i not in state.is_set
+    # A cell can not constrain itself, so only its unassigned peers count.
+    open_peers = [state.cells[p] for p in PEERS[i] if p in state.is_not_set]
     candidates: list[tuple[int, int]] = []
-    for num in state.table[row][col]:
+    for num in state.cells[i]:
         # counting how many other cells this value would restrict
-        constraint_count = 0
-        # A cell can not constrain itself so don't include it.
-        rows = set(range(9))
-        cols = set(range(9))
-        rows.remove(col)
-        cols.remove(row)
-
-        for r in rows:
-            if state.is_valid(r, col, num):
-                constraint_count += 1
-        for c in cols:
-            if state.is_valid(row, c, num):
-                constraint_count += 1
-
-        start_row, start_col = row - row % 3, col - col % 3
-        for i in range(3):
-            for j in range(3):
-                if state.is_valid(i + start_row, j + start_col, num):
-                    constraint_count += 1
-
+        constraint_count = sum(1 for peer in open_peers if num in peer)
         candidates.append((num, constraint_count))
 
     # Sort by the number of constraints (ascending)
@@ -201,48 +235,214 @@ def least_constraining_values(state: State, row: int, col: int) -> list[int]:
     return [x[0] for x in candidates]
 
 
-def solve_heuristics_root(grid: list[list[int]], verbose: bool = False) -> State:
-    state = State(grid, verbose)
-    return solve_heuristics(state)
-
-
-def solve_heuristics(state: State, depth: int = 0) -> State:
-    # tab = " " * depth
+@solution_cache.cached()
+def solve_heuristics_root(
+    grid: list[list[int]], verbose: bool = False, trace: utils.Trace | None = None
+) -> utils.SolveResult:
+    """Solve grid. verbose prints the table after every assignment; a Trace records
+    the search without printing."""
+    result = utils.SolveResult(trace=trace)
+    start_time = time.perf_counter()
+    state = solve_heuristics(State(grid, verbose), result)
+    result.elapsed = time.perf_counter() - start_time
+    if state:
+        result.solution = state.to_grid()
+    return result
+
+
+@utils.RT.hot_path
+def expand(state: State, result: utils.SolveResult, depth: int) -> search.Branch | bool:
+    """One search node: fill in the trivial cells, then pick the cell to branch on and
+    order its values."""
     if state.is_finished():
-        # every cell only has one possible value. Leave early. used lookup table
-        # print(f"{tab}finished early")
-        return state
-    while state.constrain_trivial_cells():
+        return True
+    while state.constrain_trivial_cells(result.trace, depth):
+        result.propagations += 1
         if state.is_finished():
-            return state
-    # print(f"{tab}Depth={depth}")
+            return True
     tied_cells: list[tuple[int, int, set[int]]] = most_constrained_variables(state)
-    # print(f"{tab}{len(tied_cells)} most constrained = {tied_cells}")
 
     # If there's a tie, use Most Constraining Variable to break it
     if len(tied_cells) > 1:
-        # print(f"{tab}Tie found. find most constraining")
         row, col, _ = most_constraining_variable(state, tied_cells)
     else:
         row, col, _ = tied_cells[0]
+    return row, col, least_constraining_values(state, row, col)
 
-    # print(f"{tab} most constraining = ({row},{col})={values}")
-    for num in least_constraining_values(state, row, col):
-        # print(f"Trying {num} at ({row}, {col})")
-        state.constrain(row, col, num, True)
-        if solve_heuristics(state, depth + 1):
-            # print(f"{tab}Backtracking Success")
-            return state
-    return state
+
+@utils.RT.hot_path
+def solve_heuristics(state: State, result: utils.SolveResult) -> State | None:
+    if search.Search(state, expand, result, len(state.cells)).run():
+        return state
+    return None
+
+
+# A template is the set of cells one digit occupies in a solution: one cell in every
+# row, column and box. Templates are kept as bitboards with bit row * 9 + col set,
+# split into 64 bit words. Word w of every template is row w of a (words, templates)
+# array, so numpy tests a word of all of them at once.
+TEMPLATE_WORDS = 2
+ALL_CELLS = (1 << 81) - 1
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".templates.npz")
+
+
+def _build_templates() -> np.ndarray:
+    """The 46,656 templates of a 9x9 board as a (templates, 9) array of flat cell
+    indices."""
+    templates: list[list[int]] = []
+    cells: list[int] = []
+
+    def place(row: int, cols: int, boxes: int):
+        if row == 9:
+            templates.append(cells[:])
+            return
+        for col in range(9):
+            box = (row // 3) * 3 + col // 3
+            if not (cols >> col & 1 or boxes >> box & 1):
+                cells.append(row * 9 + col)
+                place(row + 1, cols | 1 << col, boxes | 1 << box)
+                _ = cells.pop()
+
+    place(0, 0, 0)
+    return np.array(templates, dtype=np.uint8)
+
+
+def _bitboards(cells: np.ndarray) -> np.ndarray:
+    """(TEMPLATE_WORDS, templates) uint64 bitboards of (templates, 9) cell indices."""
+    boards = np.zeros((TEMPLATE_WORDS, len(cells)), dtype=np.uint64)
+    for w in range(TEMPLATE_WORDS):
+        in_word = (cells >= 64 * w) & (cells < 64 * w + 64)
+        bits = np.left_shift(np.uint64(1), (cells.astype(np.uint64) - np.uint64(64 * w)))
+        boards[w] = np.bitwise_or.reduce(np.where(in_word, bits, 0), axis=1)
+    return boards
+
+
+@cache
+def templates() -> tuple[np.ndarray, np.ndarray]:
+    """The bitboard of every template, and for every cell the indices of the 5,184
+    templates covering it. Read from TEMPLATE_PATH, or built and saved there the first
+    time they are needed."""
+    try:
+        with np.load(TEMPLATE_PATH) as saved:
+            return saved["bitboards"], saved["by_cell"]
+    except (OSError, KeyError, ValueError):
+        cells = _build_templates()
+        bitboards = _bitboards(cells)
+        by_cell = np.array(
+            [np.flatnonzero(np.any(cells == i, axis=1)) for i in range(81)],
+            dtype=np.uint16,
+        )
+        # Not being able to write the cache only costs rebuilding it next time
+        with suppress(OSError):
+            np.savez(TEMPLATE_PATH, bitboards=bitboards, by_cell=by_cell)
+        return bitboards, by_cell
+
+
+def _words(cells: int) -> list[np.uint64]:
+    return [np.uint64(cells >> 64 * w & (1 << 64) - 1) for w in range(TEMPLATE_WORDS)]
+
+
+def _disjoint(options: np.ndarray, words: list[np.uint64]) -> np.ndarray:
+    """Mask of the bitboards that share no cell with words."""
+    ok = (options[0] & words[0]) == 0
+    for w in range(1, TEMPLATE_WORDS):
+        ok &= (options[w] & words[w]) == 0
+    return ok
+
+
+def digit_templates(grid: list[list[int]]) -> list[np.ndarray]:
+    """For every digit 1 to 9, the bitboards of the templates that cover each cell the
+    digit is given in and no cell given another digit."""
+    bitboards, by_cell = templates()
+    given = [0] * 10
+    first = [-1] * 10  # A cell each digit is given in
+    for i, v in enumerate(v for row in grid for v in row):
+        given[v] |= 1 << i
+        first[v] = i
+    filled = sum(given[1:])
+    candidates: list[np.ndarray] = []
+    for digit in range(1, 10):
+        # Only the templates through one of the digit's givens need testing
+        options = bitboards if first[digit] < 0 else bitboards[:, by_cell[first[digit]]]
+        ok = _disjoint(options, _words(filled & ~given[digit]))
+        for w, must in enumerate(_words(given[digit])):
+            ok &= (options[w] & must) == must
+        candidates.append(options[:, ok])
+    return candidates
+
+
+@solution_cache.cached()
+def solve_templates(grid: list[list[int]]) -> utils.SolveResult:
+    """Solve a 9x9 grid by picking one template per digit so that no two overlap."""
+    if len(grid) != 9:
+        raise ValueError("template tables are only built for 9x9 boards")
+    result = utils.SolveResult()
+    start_time = time.perf_counter()
+    candidates = digit_templates(grid)
+    chosen = _solve_templates(dict(enumerate(candidates, start=1)), result, _words(0))
+    result.elapsed = time.perf_counter() - start_time
+    if chosen is not None:
+        solution = [[0] * 9 for _ in range(9)]
+        for digit, template in chosen.items():
+            cells = sum(int(word) << 64 * w for w, word in enumerate(template))
+            for i in range(81):
+                if cells >> i & 1:
+                    solution[i // 9][i % 9] = digit
+        result.solution = solution
+    return result
+
+
+@utils.RT.hot_path
+def _solve_templates(
+    candidates: dict[int, np.ndarray],
+    result: utils.SolveResult,
+    covered: list[np.uint64],
+    depth: int = 0,
+) -> dict[int, np.ndarray] | None:
+    """Choose a template for every digit left in candidates, trying the digit with the
+    fewest first. covered is the cells of the templates chosen so far.
+
+    Each choice drops the templates it overlaps from the other digits. It is a dead
+    end if a digit has none left, or if some cell is neither covered nor on any
+    template that is left.
+    """
+    result.enter(depth)
+    if not candidates:
+        return {}
+    digit = min(candidates, key=lambda d: candidates[d].shape[1])
+    rest = {d: t for d, t in candidates.items() if d != digit}
+    for template in candidates[digit].T:
+        remaining: dict[int, np.ndarray] = {}
+        for d, options in rest.items():
+            options = options[:, _disjoint(options, list(template))]
+            if options.shape[1] == 0:
+                break
+            remaining[d] = options
+        else:
+            result.propagations += 1
+            now_covered = [covered[w] | template[w] for w in range(TEMPLATE_WORDS)]
+            reachable = [
+                np.bitwise_or.reduce(np.concatenate([o[w] for o in remaining.values()]))
+                | now_covered[w]
+                if remaining
+                else now_covered[w]
+                for w in range(TEMPLATE_WORDS)
+            ]
+            if reachable == _words(ALL_CELLS):
+                chosen = _solve_templates(remaining, result, now_covered, depth + 1)
+                if chosen is not None:
+                    chosen[digit] = template
+                    return chosen
+        result.backtracks += 1
+    return None
 
 
 def main(board: list[list[int]], verbose: bool = False):
-    start_time = time.time()
-    solution = solve_heuristics_root(board, verbose)
-    if solution:
-        end_time = time.time()
-        grid = solution.to_grid()
-        print(f"Heuristic solving time: {end_time - start_time:.6f} seconds.")
+    result = solve_heuristics_root(board, verbose)
+    if result.solution:
+        grid = result.solution
+        print(f"Heuristic solving time: {result.elapsed:.6f} seconds.")
+        print(f"Search: {result.format_stats()}")
         print("Solution Found. Testing for accuracy...")
         if tests.is_board_solved(grid):
             print("Solution is solved and legal.")
@@ -253,19 +453,14 @@ def main(board: list[list[int]], verbose: bool = False):
         print("No solution exists.\n")
 
 
-def test(verbose: bool = False):
+def test(verbose: bool = False, corpus_path: str | None = None):
+    boards = corpus.load_boards(100, corpus_path)
     start_time = time.time()
-    boards: list[list[list[int]]] = []
-    for _ in range(1000):
-        d = random.uniform(0, 1)
-        x = Sudoku(3).difficulty(d).board
-        boards.append(solver.format_board(x))
-    for i in range(100):
-        board = boards[i]
-        _ = solve_heuristics_root(board, verbose)
-    for func, runtime in utils.RT.function_runtimes.items():
-        print(f"{func}: {runtime:.6f} seconds")
+    with utils.RT.profiling():
+        for board in boards:
+            _ = solve_heuristics_root(board, verbose)
     end_time = time.time()
+    print(utils.RT.format_table())
     print(f"Heuristic solving time: {end_time - start_time:.6f} seconds.")
 
 
@@ -1,37 +1,84 @@
 import argparse
 import time
-from copy import deepcopy
+
+import propagation
+import search
+import solution_cache
+import units
+import utils
 
 
 class State:
     table: list[list[set[int]]]
-    _is_set: set[tuple[int, int]]
-    _is_not_set: set[tuple[int, int]]
+    cells: list[set[int]]  # The sets of table, flat, indexed by row * n_squared + col
+    _is_set: set[int]  # Flat indices of set cells
+    _is_not_set: set[int]  # Flat indices of unset cells
+    # Changes made by constrain, newest last, so they can be undone when backtracking.
+    # (i, val) means val was removed from cell i, (i, -val) means it was added, and
+    # (i, 0) means the cell was marked as set.
+    _trail: list[tuple[int, int]]
+    # Unset cells bucketed by how many candidates they have left, so the most
+    # constrained cells are always in the first non-empty bucket.
+    _buckets: list[set[int]]
+    # Cells whose candidates changed since the propagator last looked at the state
+    _changed: set[int]
+    # For every unit (rows, then columns, then boxes) and value, a bitmask of the cells
+    # that can still take the value, bit i for flat cell i. A set cell counts for its own
+    # value only. _remove and _add keep it current; bit_count() of a mask is the number
+    # of places left for the value.
+    places: list[list[int]]
+    unit_ids: tuple[tuple[int, int, int], ...]  # The three units of every cell
+    eliminated: int  # Candidates removed by constrain and eliminate so far
+    propagator: propagation.Propagator
     verbose: bool = False
     n: int  # Size of the subgrid
     n_squared: int  # Size of the full grid (n^2)
     sqrt_n: int  # Size of the subgrid (sqrt(n) x sqrt(n))
 
-    def __init__(self, grid: list[list[int]], n: int, verbose: bool = False) -> None:
+    def __init__(
+        self,
+        grid: list[list[int]],
+        n: int,
+        verbose: bool = False,
+        propagator: propagation.Propagator | None = None,
+    ) -> None:
         self.table = []
         self._is_set = set()
-        self._is_not_set = set()
+        self._trail = []
+        self._changed = set()
+        self.eliminated = 0
+        if propagator is None:
+            propagator = propagation.Propagator()
+        self.propagator = propagator
         self.verbose = verbose
         self.n = n
         self.n_squared = n * n
         self.sqrt_n = n  # The subgrid size is n (e.g., for a 9x9 sudoku, n=3)
-
-        for r in range(self.n_squared):
+        self._units = units.cell_units(n)
+        self._peers = units.cell_peers(n)
+        size = self.n_squared
+        self.unit_ids = tuple((r, size + c, 2 * size + b) for r, c, b in self._units)
+        # Every cell of every unit starts out able to take every value
+        rows, cols, boxes = units.unit_cells(n)
+        self.places = [
+            [0] + [sum(1 << i for i in unit)] * size for unit in rows + cols + boxes
+        ]
+
+        for _ in range(self.n_squared):
             row: list[set[int]] = []
-            for c in range(self.n_squared):
+            for _ in range(self.n_squared):
                 row.append(set(range(1, self.n_squared + 1)))  # Values from 1 to n^2
-                self._is_not_set.add((r, c))
             self.table.append(row)
+        self.cells = [cell for row in self.table for cell in row]
+        self._is_not_set = set(range(len(self.cells)))
+        self._buckets = [set() for _ in range(self.n_squared + 1)]
+        self._buckets[self.n_squared] = set(self._is_not_set)
 
         self.init_table(grid)
 
     def is_valid(self, row: int, col: int, num: int) -> bool:
-        return (row, col) in self._is_not_set and num in self.table[row][col]
+        i = row * self.n_squared + col
+        return i in self._is_not_set and num in self.cells[i]
 
     def init_table(self, grid: list[list[int]]):
         for row in range(self.n_squared):
@@ -40,36 +87,126 @@ class State:
                 if cell != 0:
                     self.constrain(row, col, cell)
 
+    @utils.RT.hot_path
     def constrain(self, row: int, col: int, val: int, verbose: bool = False):
-        # Constrain row
-        for i in range(self.n_squared):
-            self.table[row][i].discard(val)
-            self.table[i][col].discard(val)
-
-        # Adjust for subgrid size
-        start_row, start_col = row - row % self.n, col - col % self.n
-        for i in range(self.n):
-            for j in range(self.n):
-                self.table[i + start_row][j + start_col].discard(val)
-
-        self.table[row][col] = set([val])
-        self._is_set.add((row, col))
-        self._is_not_set.remove((row, col))
+        i = row * self.n_squared + col
+        cells, trail, changed = self.cells, self._trail, self._changed
+        for p in self._peers[i]:
+            if val in cells[p]:
+                self._remove(p, val)
+                trail.append((p, val))
+                changed.add(p)
+                self.eliminated += 1
+
+        # Mark the cell as set before narrowing it down, so it leaves the buckets first
+        cell = cells[i]
+        self._buckets[len(cell)].remove(i)
+        self._is_set.add(i)
+        self._is_not_set.remove(i)
+        trail.append((i, 0))
+        for other in [v for v in cell if v != val]:
+            self._remove(i, other)
+            trail.append((i, other))
+            self.eliminated += 1
+        if val not in cell:
+            self._add(i, val)
+            trail.append((i, -val))
+        changed.add(i)
 
         if verbose or self.verbose:
             print(self.format_as_string(row, col))
 
+    def eliminate(self, i: int, val: int):
+        """Remove val from the candidates of unset cell i, if it is still there."""
+        if val in self.cells[i]:
+            self._remove(i, val)
+            self._trail.append((i, val))
+            self._changed.add(i)
+            self.eliminated += 1
+
+    def _remove(self, i: int, val: int):
+        cell = self.cells[i]
+        cell.remove(val)
+        bit = 1 << i
+        r, c, b = self.unit_ids[i]
+        places = self.places
+        places[r][val] ^= bit
+        places[c][val] ^= bit
+        places[b][val] ^= bit
+        if i in self._is_not_set:
+            self._buckets[len(cell) + 1].remove(i)
+            self._buckets[len(cell)].add(i)
+
+    def _add(self, i: int, val: int):
+        cell = self.cells[i]
+        cell.add(val)
+        bit = 1 << i
+        r, c, b = self.unit_ids[i]
+        places = self.places
+        places[r][val] |= bit
+        places[c][val] |= bit
+        places[b][val] |= bit
+        if i in self._is_not_set:
+            self._buckets[len(cell) - 1].remove(i)
+            self._buckets[len(cell)].add(i)
+
+    def mark(self) -> int:
+        """Current position in the trail, to pass to undo_to later."""
+        return len(self._trail)
+
+    def undo_to(self, mark: int):
+        """Revert every change constrain and eliminate made since mark was taken.
+
+        The state at a mark has always been propagated already, so any changes still
+        queued for the propagator are dropped.
+        """
+        self._changed.clear()
+        trail = self._trail
+        while len(trail) > mark:
+            i, val = trail.pop()
+            if val > 0:
+                self._add(i, val)
+            elif val < 0:
+                self._remove(i, -val)
+            else:
+                self._is_set.remove(i)
+                self._is_not_set.add(i)
+                self._buckets[len(self.cells[i])].add(i)
+
     def constrain_trivial_cells(self) -> bool:
         did_update = False
-        to_update = deepcopy(self._is_not_set)
-        for r, c in to_update:
-            if len(self.table[r][c]) == 1:
-                to_update.add((r, c))
+        for i in list(self._buckets[1]):
+            # An earlier assignment in this loop may have emptied the cell
+            if i in self._is_not_set and len(self.cells[i]) == 1:
                 did_update = True
-                val = next(iter(self.table[r][c]))
+                r, c, _ = self._units[i]
+                val = next(iter(self.cells[i]))
                 self.constrain(r, c, val)
         return did_update
 
+    def peers_with(self, i: int, val: int) -> int:
+        """How many unset peers of unset cell i can still take val, if i can."""
+        r, c, b = self.unit_ids[i]
+        places = self.places
+        # Set peers never hold a value an unset cell can take, and i itself is in all
+        # three masks
+        return (places[r][val] | places[c][val] | places[b][val]).bit_count() - 1
+
+    @property
+    def unset(self) -> set[int]:
+        """Flat indices of the cells that have not been set yet."""
+        return self._is_not_set
+
+    def take_changed(self) -> set[int]:
+        """Hand over the cells changed since the last call and start a new queue."""
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def propagate(self) -> bool:
+        """Run the propagator to a fixed point. Returns False on a contradiction."""
+        return self.propagator.run(self)
+
     def is_finished(self):
         return len(self._is_not_set) == 0
 
@@ -86,7 +223,7 @@ class State:
                 sb = f"{sb:9} "  # Ensure consistent spacing for the set output
             if row == color_row and col == color_col:
                 sb = f"\033[31m{sb}\033[0m"  # Color red for the selected cell
-            elif (row, col) in self._is_not_set:
+            elif row * self.n_squared + col in self._is_not_set:
                 sb = f"\033[32m{sb}\033[0m"  # Color green for unsolved cells
 
             return sb
@@ -126,23 +263,17 @@ class State:
         return grid
 
 
+@utils.RT.hot_path
 def most_constrained_variables(state: State) -> list[tuple[int, int, set[int]]]:
-    tied_cells = []
-    min_valid_values = (
-        state.n_squared + 1
-    )  # Start larger than the maximum possible number
-
-    for r, c in state._is_not_set:
-        possible_values = state.table[r][c]
-        new_min = len(possible_values)
-        if new_min == min_valid_values:
-            tied_cells.append((r, c, possible_values))
-        elif new_min < min_valid_values:
-            min_valid_values = new_min
-            tied_cells = [(r, c, possible_values)]
-    return tied_cells
+    # The buckets are kept up to date by constrain and undo_to, so the answer is the
+    # first non-empty one. The minimum is almost always 1 or 2 candidates.
+    for bucket in state._buckets:
+        if bucket:
+            return [(*state._units[i][:2], state.cells[i]) for i in bucket]
+    return []
 
 
+@utils.RT.hot_path
 def most_constraining_variable(
     state: State, tied_cells: list[tuple[int, int, set[int]]]
 ) -> tuple[int, int, set[int]]:
@@ -150,22 +281,9 @@ def most_constraining_variable(
     most_constraining_cell = tied_cells[0]
 
     for r, c, s in tied_cells:
-        constraints = 0
-        possible_values = state.table[r][c]
-
-        for i in range(state.n_squared):
-            for v in possible_values:
-                if state.is_valid(r, i, v):
-                    constraints += 1
-                if state.is_valid(i, c, v):
-                    constraints += 1
-
-        start_row, start_col = state.n * (r // state.n), state.n * (c // state.n)
-        for i in range(start_row, start_row + state.n):
-            for j in range(start_col, start_col + state.n):
-                for v in possible_values:
-                    if state.is_valid(i, j, v):
-                        constraints += 1
+        # The candidates it shares with its unset peers, one value at a time
+        i = r * state.n_squared + c
+        constraints = sum(state.peers_with(i, v) for v in s)
 
         if constraints > max_constraints:
             max_constraints = constraints
@@ -174,74 +292,70 @@ def most_constraining_variable(
     return most_constraining_cell
 
 
+@utils.RT.hot_path
 def least_constraining_values(state: State, row: int, col: int) -> list[int]:
-    assert (row, col) not in state._is_set
-    candidates = []
-    for num in state.table[row][col]:
-        constraint_count = 0
-        rows = set(range(state.n_squared))
-        cols = set(range(state.n_squared))
-        rows.remove(col)
-        cols.remove(row)
-
-        for r in rows:
-            if state.is_valid(r, col, num):
-                constraint_count += 1
-        for c in cols:
-            if state.is_valid(row, c, num):
-                constraint_count += 1
-
-        start_row, start_col = row - row % state.n, col - col % state.n
-        for i in range(state.n):
-            for j in range(state.n):
-                if state.is_valid(i + start_row, j + start_col, num):
-                    constraint_count += 1
-
-        candidates.append((num, constraint_count))
+    i = row * state.n_squared + col
+    assert i not in state._is_set
+    candidates = [(num, state.peers_with(i, num)) for num in state.cells[i]]
 
     candidates.sort(key=lambda x: x[1])
     return [x[0] for x in candidates]
 
 
+@solution_cache.cached()
 def solve_heuristics_root(
-    grid: list[list[int]], n: int, verbose: bool = False
-) -> State:
-    state = State(grid, n, verbose)
-    return solve_heuristics(state)
-
-
-def solve_heuristics(state: State, depth: int = 0) -> State:
+    grid: list[list[int]],
+    n: int,
+    verbose: bool = False,
+    propagator: propagation.Propagator | None = None,
+) -> utils.SolveResult:
+    result = utils.SolveResult()
+    start_time = time.perf_counter()
+    state = solve_heuristics(State(grid, n, verbose, propagator), result)
+    result.elapsed = time.perf_counter() - start_time
+    if state:
+        result.solution = state.to_grid()
+    return result
+
+
+@utils.RT.hot_path
+def expand(state: State, result: utils.SolveResult, depth: int) -> search.Branch | bool:
+    """One search node: propagate, then pick the cell to branch on and order its
+    values."""
+    result.propagations += 1
+    if not state.propagate():
+        return False
     if state.is_finished():
-        return state
-    while state.constrain_trivial_cells():
-        if state.is_finished():
-            return state
+        return True
     tied_cells = most_constrained_variables(state)
     if len(tied_cells) > 1:
         row, col, _ = most_constraining_variable(state, tied_cells)
     else:
         row, col, _ = tied_cells[0]
+    return row, col, least_constraining_values(state, row, col)
+
 
-    for num in least_constraining_values(state, row, col):
-        state.constrain(row, col, num, False)
-        if solve_heuristics(state, depth + 1):
-            return state
-    return state
+@utils.RT.hot_path
+def solve_heuristics(state: State, result: utils.SolveResult) -> State | None:
+    if search.Search(state, expand, result, len(state.cells)).run():
+        return state
+    return None
 
 
 def main(n: int, verbose: bool = False):
-    print(f"Running Sudoku solver for a {n*n} grid")
+    print(f"Running Sudoku solver for a {n * n} grid")
     print(f"Verbose mode: {verbose}")
     # Generate an nxn grid filled with zeros
     board = [[0 for _ in range(n**2)] for _ in range(n**2)]
 
-    start_time = time.time()
-    solution = solve_heuristics_root(board, n, verbose)
-    if solution:
-        end_time = time.time()
-        print(solution.format_as_string())
-        print(f"Heuristic solving time: {end_time - start_time:.6f} seconds.")
+    propagator = propagation.Propagator()
+    result = solve_heuristics_root(board, n, verbose, propagator)
+    if result.solution:
+        print(State(result.solution, n).format_as_string())
+        print(f"Heuristic solving time: {result.elapsed:.6f} seconds.")
+        print(f"Search: {result.format_stats()}")
         print("Solution is solved and legal.")
+        print(propagator.format_counts())
     else:
         print("No solution exists.\n")
 
@@ -0,0 +1,321 @@
+# parallel.py
+import argparse
+import math
+import multiprocessing
+import os
+import queue
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Event
+
+import benchmark
+import bitboard
+import nxn_sudoku
+import search
+import utils
+
+Grid = list[list[int]]
+# (row, col, val) choices from the root of the search tree, shallowest first
+Prefix = list[tuple[int, int, int]]
+# Solution if found, nodes, backtracks, propagations, max depth and the number of times
+# the task gave work away
+TaskResult = tuple[Grid | None, int, int, int, int, int]
+
+# Set in each worker process by _init_worker
+_stop: Event | None = None  # Set once any task has a solution
+_hungry: Event | None = None  # Set while workers are running out of tasks
+_donations: "Queue[list[Prefix]] | None" = None  # Prefixes given away by busy tasks
+# The board this worker last searched: the grid, its state (None if the board has no
+# solution), the choices made on it for the last task and the marks after the root and
+# after each choice. The next task on the board only redoes the choices it does not
+# share with the last one.
+_board: tuple[Grid, nxn_sudoku.State | None, Prefix, list[int]] | None = None
+
+
+def _init_worker(stop: Event, hungry: Event, donations: "Queue[list[Prefix]]"):
+    global _stop, _hungry, _donations
+    _stop, _hungry, _donations = stop, hungry, donations
+
+
+def _state_at(
+    grid: Grid, n: int, prefix: Prefix, result: utils.SolveResult
+) -> nxn_sudoku.State | None:
+    """The state of grid after the choices of prefix, propagating after each as the
+    search that made the prefix did, or None on a contradiction.
+
+    Building the state and replaying a long prefix is much of the cost of a task on a
+    large board, and tasks are handed out in the order the serial search visits them,
+    so one after another mostly share their prefixes. The worker keeps one state per
+    board and undoes it only back to where the new prefix leaves the last one.
+    """
+    global _board
+    if _board is None or _board[0] != grid:
+        state = nxn_sudoku.State(grid, n)
+        result.propagations += 1
+        _board = (grid, state if state.propagate() else None, [], [state.mark()])
+    _, state, path, marks = _board
+    if state is None:
+        return None
+    common = 0
+    while common < min(len(path), len(prefix)) and path[common] == prefix[common]:
+        common += 1
+    state.undo_to(marks[common])
+    del path[common:], marks[common + 1 :]
+    for row, col, val in prefix[common:]:
+        state.constrain(row, col, val)
+        result.propagations += 1
+        if not state.propagate():
+            return None
+        path.append((row, col, val))
+        marks.append(state.mark())
+    return state
+
+
+def _search_prefix(grid: Grid, n: int, prefix: Prefix, slice_nodes: int) -> TaskResult:
+    """Search the subtree under prefix, slice_nodes nodes at a time. Between slices
+    it stops if another task has found a solution, and gives away the untried values
+    of its shallowest choice if the workers are running out of tasks."""
+    assert _stop is not None and _hungry is not None and _donations is not None
+    result = utils.SolveResult()
+    donated = 0
+    solution = None
+    state = _state_at(grid, n, prefix, result)
+    if state is not None:
+        tree = search.Search(state, nxn_sudoku.expand, result, len(state.cells))
+        while (solved := tree.run(slice_nodes)) is None:
+            if _stop.is_set():
+                break
+            if _hungry.is_set() and (work := tree.split()):
+                _hungry.clear()
+                _donations.put([prefix + choices for choices in work])
+                donated += 1
+        if solved:
+            solution = state.to_grid()
+    depth = result.max_depth + len(prefix)
+    return (
+        solution,
+        result.nodes,
+        result.backtracks,
+        result.propagations,
+        depth,
+        donated,
+    )
+
+
+class ParallelSolver:
+    """Solves one board with every worker process searching a part of its tree.
+
+    The search starts here, serially, for head_start nodes, which is all an easy board
+    needs. Whatever is left of the tree is then split into subtrees, each named by the
+    choices that lead to it: the one the search was in, then the untried values of
+    every choice on its path, deepest first, which is the order the serial search would
+    visit them in. Each subtree is a task for the pool. When fewer tasks are left than
+    workers, busy tasks are asked to give away the untried values of their shallowest
+    choice as new tasks, so work keeps moving to idle workers. The first solution found
+    stops every task.
+    """
+
+    workers: int
+    head_start: int  # Nodes searched here before splitting the tree
+    slice_nodes: int  # Nodes a task searches between checking in
+    _stop: Event
+    _hungry: Event
+    _donations: "Queue[list[Prefix]]"
+    _executor: ProcessPoolExecutor
+
+    def __init__(
+        self, workers: int | None = None, head_start: int = 16, slice_nodes: int = 32
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.head_start = head_start
+        self.slice_nodes = slice_nodes
+        self._stop = multiprocessing.Event()
+        self._hungry = multiprocessing.Event()
+        self._donations = multiprocessing.Queue()
+        self._executor = ProcessPoolExecutor(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self._stop, self._hungry, self._donations),
+        )
+        # The pool starts its processes on demand, so give every worker a task now
+        warmups = [self._executor.submit(os.getpid) for _ in range(self.workers)]
+        for future in warmups:
+            _ = future.result()
+
+    def _split(
+        self, grid: Grid, n: int, result: utils.SolveResult
+    ) -> tuple[list[Prefix], Grid | None]:
+        """Search for head_start nodes, then split what is left of the tree into
+        prefixes. Returns no prefixes if the search finished, with the solution if it
+        found one."""
+        state = nxn_sudoku.State(grid, n)
+        tree = search.Search(state, nxn_sudoku.expand, result, len(state.cells))
+        solved = tree.run(self.head_start)
+        if solved is not None:
+            return [], state.to_grid() if solved else None
+        splits: list[list[Prefix]] = []
+        while work := tree.split():
+            splits.append(work)
+        # split gives the shallowest choice first, and the serial search would try
+        # the deepest first
+        return [tree.path()] + [p for work in reversed(splits) for p in work], None
+
+    def solve(self, grid: Grid) -> utils.SolveResult:
+        n = math.isqrt(len(grid))
+        result = utils.SolveResult()
+        start_time = time.perf_counter()
+        prefixes, result.solution = self._split(grid, n, result)
+
+        pending: set[Future[TaskResult]] = set()
+
+        def submit(prefix: Prefix):
+            pending.add(
+                self._executor.submit(_search_prefix, grid, n, prefix, self.slice_nodes)
+            )
+
+        for prefix in prefixes:
+            submit(prefix)
+        # Tasks report how many donations they made, so none is left behind in the
+        # queue when the last task finishes
+        expected = received = 0
+        try:
+            while (pending or received < expected) and result.solution is None:
+                done, pending = wait(pending, timeout=0.005, return_when=FIRST_COMPLETED)
+                for future in done:
+                    solution, nodes, backtracks, propagations, depth, donated = (
+                        future.result()
+                    )
+                    result.nodes += nodes
+                    result.backtracks += backtracks
+                    result.propagations += propagations
+                    result.max_depth = max(result.max_depth, depth)
+                    expected += donated
+                    if solution is not None:
+                        result.solution = solution
+                if len(pending) < self.workers:
+                    self._hungry.set()
+                while True:
+                    try:
+                        # Only wait when no task is left to report the donation
+                        donation = self._donations.get(not pending, 0.005)
+                    except queue.Empty:
+                        break
+                    received += 1
+                    for prefix in donation:
+                        submit(prefix)
+        finally:
+            # Stop the tasks still running and drop the rest, so the pool is clean for
+            # the next board
+            self._stop.set()
+            for future in pending:
+                _ = future.cancel()
+            for future in wait(pending).done:
+                if not future.cancelled() and future.exception() is None:
+                    expected += future.result()[-1]
+            while received < expected:
+                _ = self._donations.get()
+                received += 1
+            self._stop.clear()
+            self._hungry.clear()
+        result.elapsed = time.perf_counter() - start_time
+        return result
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+def solve(grid: Grid, workers: int | None = None) -> utils.SolveResult:
+    """Solve one board with ParallelSolver, in a pool started for it."""
+    solver = ParallelSolver(workers)
+    try:
+        return solver.solve(grid)
+    finally:
+        solver.close()
+
+
+def main(
+    sets: dict[str, list[Grid]], workers: int | None, head_start: int, slice_nodes: int
+):
+    solver = ParallelSolver(workers, head_start, slice_nodes)
+    print(f"{solver.workers} workers")
+    print(f"{'set':>12} {'board':>5} {'serial':>10} {'parallel':>10} {'speedup':>8}")
+    try:
+        for name, grids in sets.items():
+            speedups: list[float] = []
+            for i, grid in enumerate(grids):
+                n = math.isqrt(len(grid))
+                serial = nxn_sudoku.solve_heuristics_root(grid, n)
+                parallel = solver.solve(grid)
+                assert parallel.solution is not None or serial.solution is None
+                speedups.append(serial.elapsed / parallel.elapsed)
+                print(
+                    f"{name:>12} {i:>5} {serial.elapsed * 1000:>8.1f}ms "
+                    f"{parallel.elapsed * 1000:>8.1f}ms {speedups[-1]:>7.2f}x"
+                )
+            print(
+                f"{name:>12} {'all':>5} {'':>10} {'':>10} "
+                f"{statistics.geometric_mean(speedups):>7.2f}x (geometric mean)"
+            )
+    finally:
+        solver.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare solving single boards in parallel against the serial search."
+    )
+    _ = parser.add_argument(
+        "-s",
+        "--sets",
+        nargs="+",
+        choices=benchmark.SET_NAMES,
+        default=None,
+        help="Puzzle sets to run (default is 16x16 25x25)",
+    )
+    _ = parser.add_argument(
+        "--givens",
+        type=float,
+        default=None,
+        help="Run generated boards with this fraction of givens instead of the sets",
+    )
+    _ = parser.add_argument(
+        "-n", type=int, default=5, help="Subgrid size of generated boards (default 5)"
+    )
+    _ = parser.add_argument(
+        "--count", type=int, default=4, help="Generated boards to run (default 4)"
+    )
+    _ = parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default is one per CPU)",
+    )
+    _ = parser.add_argument(
+        "--head-start",
+        type=int,
+        default=16,
+        help="Nodes to search serially before splitting the tree (default 16)",
+    )
+    _ = parser.add_argument(
+        "--slice",
+        type=int,
+        default=32,
+        help="Nodes a task searches between checking for a solution elsewhere",
+    )
+    args = parser.parse_args()
+
+    if args.givens is None:
+        puzzle_sets = benchmark.puzzle_sets()
+        sets = {name: puzzle_sets[name] for name in args.sets or ["16x16", "25x25"]}
+    else:
+        size = args.n * args.n
+        sets = {
+            f"{size}x{size}@{args.givens}": [
+                bitboard.puzzle_grid(args.n, args.givens, seed)
+                for seed in range(args.count)
+            ]
+        }
+    main(sets, args.workers, args.head_start, args.slice)
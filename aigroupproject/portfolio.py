@@ -0,0 +1,417 @@
+# portfolio.py
+import argparse
+import atexit
+import json
+import math
+import multiprocessing
+import os
+import random
+import signal
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing.connection import Connection, wait
+from multiprocessing.process import BaseProcess
+from multiprocessing.sharedctypes import Synchronized
+from typing import Any, cast
+
+import benchmark
+import brute_force as bf
+import bulk
+import dlx
+import legality
+import lookup_table as tbl
+import nxn_sudoku
+import search
+import utils
+
+Grid = list[list[int]]
+Solve = Callable[[Grid], utils.SolveResult]
+# What a worker sends back for every board: the result, or an error message
+Reply = tuple[utils.SolveResult | None, str | None]
+
+CANCELLED = "cancelled"
+
+
+def _randomized_expand(rng: random.Random) -> search.Expand:
+    """nxn_sudoku.expand with ties broken at random: any of the cells with the fewest
+    candidates instead of the one with the most unset peers, and values with the same
+    LCV score in random order."""
+
+    def expand(
+        state: nxn_sudoku.State, result: utils.SolveResult, depth: int
+    ) -> search.Branch | bool:
+        result.propagations += 1
+        if not state.propagate():
+            return False
+        if state.is_finished():
+            return True
+        row, col, _ = rng.choice(nxn_sudoku.most_constrained_variables(state))
+        i = row * state.n_squared + col
+        values = sorted(
+            state.cells[i], key=lambda v: (state.peers_with(i, v), rng.random())
+        )
+        return row, col, values
+
+    return expand
+
+
+def solve_randomized(grid: Grid, seed: int = 0) -> utils.SolveResult:
+    """The nxn_sudoku search with seeded random tie-breaking. Different seeds take
+    different paths, so racing a few of them hedges against an unlucky order."""
+    result = utils.SolveResult()
+    start_time = time.perf_counter()
+    state = nxn_sudoku.State(grid, math.isqrt(len(grid)))
+    expand = _randomized_expand(random.Random(seed))
+    if search.Search(state, expand, result, len(state.cells)).run():
+        result.solution = state.to_grid()
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+@dataclass(frozen=True)
+class Strategy:
+    name: str
+    solve: Solve
+    sizes: tuple[int, ...] | None = None  # Box sizes it can solve, None for any
+
+    def supports(self, n: int) -> bool:
+        return self.sizes is None or n in self.sizes
+
+
+STRATEGIES: dict[str, Strategy] = {
+    strategy.name: strategy
+    for strategy in [
+        Strategy("dlx", dlx.solve),
+        Strategy("brute_force", bf.brute_force),
+        Strategy("nxn", bulk.SOLVERS["nxn"]),
+        Strategy("nxn-random-1", partial(solve_randomized, seed=1)),
+        Strategy("nxn-random-2", partial(solve_randomized, seed=2)),
+        Strategy("templates", tbl.solve_templates, sizes=(3,)),
+    ]
+}
+DEFAULT_STRATEGIES = ["dlx", "brute_force", "nxn", "nxn-random-1"]
+
+
+class Cancelled(Exception):
+    pass
+
+
+# Set in each worker process by _run_strategy
+_cancelled: "Synchronized[int] | None" = None  # Number of the last board cancelled
+_board = -1  # Number of the board being solved, -1 between boards
+
+
+def _cancel(signum: int, frame: object):
+    # The signal can come before the worker has read the board it cancels, or after
+    # it has answered it, so only stop a solve of the board it was meant for
+    if _cancelled is not None and _board == _cancelled.value:
+        raise Cancelled
+
+
+def _run_strategy(strategy: Strategy, conn: Connection, cancelled: "Synchronized[int]"):
+    """Worker process loop: reply to every (number, board) sent down conn until None
+    is sent. SIGUSR1 abandons the board if its number is in cancelled."""
+    global _cancelled, _board
+    _cancelled = cancelled
+    _ = signal.signal(signal.SIGUSR1, _cancel)
+    # Build imports and per-size tables before the first race
+    if strategy.supports(3):
+        _ = strategy.solve(bulk.parse_puzzle(benchmark.EASY[0]))
+    while (message := conn.recv()) is not None:
+        reply: Reply
+        try:
+            _board, grid = message
+            if _board == cancelled.value:
+                raise Cancelled
+            reply = (strategy.solve(grid), None)
+        except Cancelled:
+            reply = (None, CANCELLED)
+        except Exception as e:
+            reply = (None, repr(e))
+        finally:
+            _board = -1
+        conn.send(reply)
+
+
+class _Runner:
+    """The worker process of one strategy and our end of its pipe."""
+
+    strategy: Strategy
+    process: BaseProcess | None
+    conn: Connection | None
+    owed: bool  # A board was sent and its reply not read yet
+    board: int  # Number of the last board sent
+    cancelled: "Synchronized[int]"  # Number of the last board cancelled
+
+    def __init__(self, strategy: Strategy) -> None:
+        self.strategy = strategy
+        self.process = None
+        self.conn = None
+        self.owed = False
+        self.board = -1
+        self.cancelled = multiprocessing.Value("i", -1)
+
+    def start(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_run_strategy,
+            args=(self.strategy, child, self.cancelled),
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.owed = False
+
+    def settle(self, timeout: float):
+        """Read the reply still owed for an earlier board, which a cancelled solve
+        sends at once. A worker that does not answer in time is replaced."""
+        if self.conn is None or not self.owed:
+            return
+        if self.conn.poll(timeout):
+            try:
+                _ = self.conn.recv()
+                self.owed = False
+                return
+            except EOFError:
+                pass
+        self.stop(kill=True)
+        self.start()
+
+    def send(self, grid: Grid):
+        assert self.conn is not None
+        self.board += 1
+        self.conn.send((self.board, grid))
+        self.owed = True
+
+    def cancel(self):
+        """Abandon the last board sent. Its reply is still owed."""
+        self.cancelled.value = self.board
+        if self.process is not None and self.process.pid is not None:
+            os.kill(self.process.pid, signal.SIGUSR1)
+
+    def stop(self, kill: bool = False):
+        if self.process is None or self.conn is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            self.settle(1.0)
+            self.conn.send(None)
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = self.conn = None
+
+
+class Portfolio:
+    """Races several strategies on a board and takes the first answer.
+
+    Every strategy has its own worker process, kept between boards. Each board goes to
+    every strategy that handles its size; the first to answer, with a solution or with
+    proof there is none, wins, and the rest are told to abandon the board. Wins are
+    counted per strategy, and with a log_path every race is appended to that file as
+    a JSON line, so the default strategies can be tuned from real workloads.
+    """
+
+    strategies: list[Strategy]
+    timeout: float | None  # Seconds to wait for an answer, None for no limit
+    log_path: str | None
+    wins: Counter[str]
+    _runners: list[_Runner]
+
+    def __init__(
+        self,
+        strategies: list[str] | None = None,
+        timeout: float | None = None,
+        log_path: str | None = None,
+    ) -> None:
+        names = strategies or DEFAULT_STRATEGIES
+        unknown = [name for name in names if name not in STRATEGIES]
+        if unknown:
+            raise ValueError(f"unknown strategies {', '.join(unknown)}")
+        self.strategies = [STRATEGIES[name] for name in names]
+        self.timeout = timeout
+        self.log_path = log_path
+        self.wins = Counter()
+        self._runners = [_Runner(strategy) for strategy in self.strategies]
+        for runner in self._runners:
+            runner.start()
+
+    def race(self, grid: Grid) -> tuple[str | None, utils.SolveResult]:
+        """The winning strategy's name and result. The name is None if no strategy
+        answered in time. The result's elapsed is the wall time of the race."""
+        start_time = time.perf_counter()
+        n = math.isqrt(len(grid))
+        # Not every strategy copes with givens that already clash
+        if legality.first_bad_unit(grid, complete=False) is not None:
+            return None, utils.SolveResult(elapsed=time.perf_counter() - start_time)
+        runners = [r for r in self._runners if r.strategy.supports(n)]
+        if not runners:
+            raise ValueError(
+                f"no strategy in the portfolio solves {n * n}x{n * n} boards"
+            )
+
+        waiting: dict[Connection, _Runner] = {}
+        for runner in runners:
+            runner.settle(1.0)
+            runner.send(grid)
+            assert runner.conn is not None
+            waiting[runner.conn] = runner
+        winner: _Runner | None = None
+        result = utils.SolveResult()
+        deadline = None if self.timeout is None else start_time + self.timeout
+        while waiting and winner is None:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            ready = wait(list(waiting), remaining)
+            if not ready:
+                break
+            for ready_conn in ready:
+                conn = cast(Connection, ready_conn)
+                runner = waiting.pop(conn)
+                try:
+                    answer, _ = cast(Reply, conn.recv())
+                except EOFError:
+                    # The worker died; start a new one for the next board
+                    runner.stop(kill=True)
+                    runner.start()
+                    continue
+                runner.owed = False
+                if answer is not None and winner is None:
+                    winner, result = runner, answer
+        # Stop the losers' work now; their replies are read before their next board
+        for runner in waiting.values():
+            runner.cancel()
+
+        solve_elapsed = result.elapsed
+        result.elapsed = time.perf_counter() - start_time
+        name = None if winner is None else winner.strategy.name
+        self._record(n, grid, name, result, solve_elapsed, runners)
+        return name, result
+
+    def solve(self, grid: Grid) -> utils.SolveResult:
+        return self.race(grid)[1]
+
+    def _record(
+        self,
+        n: int,
+        grid: Grid,
+        winner: str | None,
+        result: utils.SolveResult,
+        solve_elapsed: float,
+        runners: list[_Runner],
+    ):
+        self.wins[winner or "none"] += 1
+        if self.log_path is None:
+            return
+        entry = {
+            "time": time.time(),
+            "size": n * n,
+            "givens": sum(1 for row in grid for v in row if v),
+            "strategies": [runner.strategy.name for runner in runners],
+            "winner": winner,
+            "solved": result.solution is not None,
+            "elapsed": result.elapsed,
+            "solve_elapsed": solve_elapsed,
+            "nodes": result.nodes,
+        }
+        with open(self.log_path, "a") as f:
+            _ = f.write(json.dumps(entry) + "\n")
+
+    def format_wins(self) -> str:
+        total = sum(self.wins.values())
+        return ", ".join(
+            f"{name} {count} ({count / total:.0%})"
+            for name, count in self.wins.most_common()
+        )
+
+    def close(self):
+        for runner in self._runners:
+            runner.stop()
+
+
+_default: Portfolio | None = None
+
+
+def solve(grid: Grid) -> utils.SolveResult:
+    """Race the default strategies, in a portfolio started on first use."""
+    global _default
+    if _default is None:
+        _default = Portfolio()
+        atexit.register(_default.close)
+    return _default.solve(grid)
+
+
+def summarize(log_path: str) -> dict[int, Counter[str]]:
+    """Wins per strategy for every board size in a race log."""
+    wins: dict[int, Counter[str]] = {}
+    with open(log_path) as f:
+        for line in f:
+            entry: dict[str, Any] = json.loads(line)
+            wins.setdefault(entry["size"], Counter())[entry["winner"] or "none"] += 1
+    return wins
+
+
+def main(set_names: list[str], strategies: list[str], log_path: str | None):
+    puzzle_sets = benchmark.puzzle_sets()
+    portfolio = Portfolio(strategies, log_path=log_path)
+    try:
+        for name in set_names:
+            before = Counter(portfolio.wins)
+            elapsed: list[float] = []
+            for grid in puzzle_sets[name]:
+                _, result = portfolio.race(grid)
+                elapsed.append(result.elapsed * 1000)
+            wins = portfolio.wins - before
+            print(
+                f"{name:>12}: median {benchmark.percentile(elapsed, 50):.3f} ms, "
+                f"max {max(elapsed):.3f} ms, won by "
+                + ", ".join(f"{winner} {count}" for winner, count in wins.most_common())
+            )
+        print(f"Overall: {portfolio.format_wins()}")
+    finally:
+        portfolio.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Race solver strategies on the benchmark sets and report who wins."
+    )
+    _ = parser.add_argument(
+        "-s",
+        "--sets",
+        nargs="+",
+        choices=benchmark.SET_NAMES,
+        default=None,
+        help="Puzzle sets to race on (default is every set)",
+    )
+    _ = parser.add_argument(
+        "--strategies",
+        nargs="+",
+        choices=list(STRATEGIES),
+        default=None,
+        help=f"Strategies to race (default is {' '.join(DEFAULT_STRATEGIES)})",
+    )
+    _ = parser.add_argument(
+        "--log", default=None, help="Append every race to this file as a JSON line"
+    )
+    _ = parser.add_argument(
+        "--summary",
+        default=None,
+        help="Print the wins per board size in a race log instead of racing",
+    )
+    args = parser.parse_args()
+
+    if args.summary is not None:
+        for size, wins in sorted(summarize(args.summary).items()):
+            races = sum(wins.values())
+            print(
+                f"{size}x{size}: {races} races, "
+                + ", ".join(f"{name} {n / races:.0%}" for name, n in wins.most_common())
+            )
+    else:
+        main(args.sets or benchmark.SET_NAMES, args.strategies, args.log)
@@ -0,0 +1,209 @@
+# propagation.py
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+import units
+
+if TYPE_CHECKING:
+    from nxn_sudoku import State
+
+# A strategy looks at the units around the given changed cells, makes whatever
+# assignments and eliminations it can through the State, and returns False if it finds a
+# contradiction.
+Strategy = Callable[["State", set[int]], bool]
+
+
+def _touched_units(state: "State", cells: set[int]) -> list[tuple[int, ...]]:
+    """The rows, columns and boxes containing any of the given cells."""
+    rows, cols, boxes = units.unit_cells(state.n)
+    cell_units = units.cell_units(state.n)
+    touched: set[tuple[int, ...]] = set()
+    for i in cells:
+        r, c, b = cell_units[i]
+        touched.add(rows[r])
+        touched.add(cols[c])
+        touched.add(boxes[b])
+    return list(touched)
+
+
+def _places(state: "State", unit: tuple[int, ...]) -> dict[int, list[int]]:
+    """For every value still open in a unit, the unset cells that can take it."""
+    places: dict[int, list[int]] = {}
+    for p in unit:
+        if p in state.unset:
+            for v in state.cells[p]:
+                places.setdefault(v, []).append(p)
+    return places
+
+
+def naked_singles(state: "State", cells: set[int]) -> bool:
+    """A cell with one candidate left takes that value."""
+    cell_units = units.cell_units(state.n)
+    for i in cells:
+        if i not in state.unset:
+            continue
+        cell = state.cells[i]
+        if not cell:
+            return False
+        if len(cell) == 1:
+            r, c, _ = cell_units[i]
+            state.constrain(r, c, next(iter(cell)))
+    return True
+
+
+def hidden_singles(state: "State", cells: set[int]) -> bool:
+    """A value that fits in only one cell of a unit goes in that cell."""
+    cell_units = units.cell_units(state.n)
+    touched: set[int] = set()
+    for i in cells:
+        touched.update(state.unit_ids[i])
+    for u in touched:
+        # Set cells count for their own value, so one place is either the value
+        # already placed or a hidden single, and none is a contradiction
+        places = state.places[u]
+        for v in range(1, state.n_squared + 1):
+            count = places[v].bit_count()
+            if count == 0:
+                return False
+            if count == 1:
+                p = places[v].bit_length() - 1
+                if p in state.unset:
+                    r, c, _ = cell_units[p]
+                    state.constrain(r, c, v)
+    return True
+
+
+def naked_pairs(state: "State", cells: set[int]) -> bool:
+    """Two cells of a unit with the same two candidates hold those two values between
+    them, so no other cell in the unit can."""
+    for unit in _touched_units(state, cells):
+        seen: dict[frozenset[int], int] = {}
+        for p in unit:
+            if p not in state.unset or len(state.cells[p]) != 2:
+                continue
+            pair = frozenset(state.cells[p])
+            if pair not in seen:
+                seen[pair] = p
+                continue
+            for other in unit:
+                if other != p and other != seen[pair] and other in state.unset:
+                    for v in pair:
+                        state.eliminate(other, v)
+    return True
+
+
+def hidden_pairs(state: "State", cells: set[int]) -> bool:
+    """Two values that can only go in the same two cells of a unit take up those cells,
+    so every other candidate is removed from them."""
+    for unit in _touched_units(state, cells):
+        pairs: dict[tuple[int, ...], int] = {}
+        for v, where in _places(state, unit).items():
+            if len(where) != 2:
+                continue
+            key = tuple(where)
+            if key not in pairs:
+                pairs[key] = v
+                continue
+            keep = {v, pairs[key]}
+            for p in key:
+                for other in [x for x in state.cells[p] if x not in keep]:
+                    state.eliminate(p, other)
+    return True
+
+
+def pointing(state: "State", cells: set[int]) -> bool:
+    """Pointing pairs and box/line reduction.
+
+    If every place for a value in a box lies on one row or column, the value can be
+    removed from the rest of that line. If every place for a value in a line lies in one
+    box, it can be removed from the rest of that box.
+    """
+    rows, cols, boxes = units.unit_cells(state.n)
+    cell_units = units.cell_units(state.n)
+    touched_rows: set[int] = set()
+    touched_cols: set[int] = set()
+    touched_boxes: set[int] = set()
+    for i in cells:
+        r, c, b = cell_units[i]
+        touched_rows.add(r)
+        touched_cols.add(c)
+        touched_boxes.add(b)
+
+    for b in touched_boxes:
+        for v, where in _places(state, boxes[b]).items():
+            line_rows = {cell_units[p][0] for p in where}
+            line_cols = {cell_units[p][1] for p in where}
+            if len(line_rows) == 1:
+                for p in rows[line_rows.pop()]:
+                    if cell_units[p][2] != b and p in state.unset:
+                        state.eliminate(p, v)
+            if len(line_cols) == 1:
+                for p in cols[line_cols.pop()]:
+                    if cell_units[p][2] != b and p in state.unset:
+                        state.eliminate(p, v)
+
+    for lines, touched, axis in ((rows, touched_rows, 0), (cols, touched_cols, 1)):
+        for line in touched:
+            for v, where in _places(state, lines[line]).items():
+                line_boxes = {cell_units[p][2] for p in where}
+                if len(line_boxes) == 1:
+                    for p in boxes[line_boxes.pop()]:
+                        if cell_units[p][axis] != line and p in state.unset:
+                            state.eliminate(p, v)
+    return True
+
+
+# Cheapest first. A strategy only runs once every strategy before it has nothing left
+# to look at.
+DEFAULT_STRATEGIES: list[Strategy] = [
+    naked_singles,
+    hidden_singles,
+    naked_pairs,
+    hidden_pairs,
+    pointing,
+]
+
+
+class Propagator:
+    """Runs a list of strategies over a State until none of them can change it.
+
+    Every strategy keeps its own queue of cells whose candidates changed since it last
+    ran, so each one sees every change exactly once. ``eliminations`` counts the
+    candidates each strategy removed, including those removed by the assignments it
+    made.
+    """
+
+    strategies: list[Strategy]
+    eliminations: dict[str, int]
+
+    def __init__(self, strategies: list[Strategy] | None = None) -> None:
+        self.strategies = list(DEFAULT_STRATEGIES if strategies is None else strategies)
+        self.eliminations = {strategy.__name__: 0 for strategy in self.strategies}
+
+    def run(self, state: "State") -> bool:
+        """Propagate to a fixed point. Returns False if the state has no solution."""
+        pending: list[set[int]] = [set() for _ in self.strategies]
+        while True:
+            changed = state.take_changed()
+            if changed:
+                for cells in pending:
+                    cells |= changed
+
+            k = next((k for k, cells in enumerate(pending) if cells), None)
+            if k is None:
+                return True
+
+            cells = pending[k]
+            pending[k] = set()
+            strategy = self.strategies[k]
+            before = state.eliminated
+            ok = strategy(state, cells)
+            self.eliminations[strategy.__name__] += state.eliminated - before
+            if not ok:
+                return False
+
+    def format_counts(self) -> str:
+        return "\n".join(
+            f"{name:>15}: {count} eliminations"
+            for name, count in self.eliminations.items()
+        )
@@ -0,0 +1,153 @@
+# search.py
+from collections.abc import Callable
+from typing import Any, Protocol
+
+import utils
+
+# The cell a search node branches on and the values to try in it, in order
+Branch = tuple[int, int, list[int]]
+
+
+class Searchable(Protocol):
+    """What Search needs from a state: assigning a value, and undoing every change made
+    since a mark. nxn_sudoku, lookup_table and bitboard states and Occupancy all fit."""
+
+    def mark(self) -> int: ...
+
+    def undo_to(self, mark: int) -> None: ...
+
+    def constrain(self, row: int, col: int, val: int) -> None: ...
+
+
+# Does the work of a search node at the given depth on the Searchable state: propagates,
+# then returns True if the state is solved, False if it is a dead end, or the Branch to
+# try next
+Expand = Callable[[Any, utils.SolveResult, int], Branch | bool]
+
+
+class Search:
+    """Depth-first search over a state, driven by a loop and an explicit stack of
+    choices instead of recursion, so deep boards never near the recursion limit.
+
+    The stack has one frame per depth, preallocated for capacity levels (the number of
+    cells is always enough): the cell branched on, its values, the next value to try and
+    the state mark to undo back to. run can stop after a budget of nodes and carry on
+    where it left off on the next call, and depth and path show where it is meanwhile.
+    """
+
+    state: Searchable
+    result: utils.SolveResult
+    solved: bool | None  # None until the search finishes
+    depth: int  # Depth of the node being searched
+    _expand: Expand
+    _pending: bool  # The node at depth has not been expanded yet
+    _top: int  # Frames in use
+    _rows: list[int]
+    _cols: list[int]
+    _values: list[list[int]]
+    _next: list[int]  # Index of the next value to try, one past the one in place
+    _marks: list[int]
+
+    def __init__(
+        self,
+        state: Searchable,
+        expand: Expand,
+        result: utils.SolveResult,
+        capacity: int,
+    ) -> None:
+        self.state = state
+        self.result = result
+        self.solved = None
+        self.depth = 0
+        self._expand = expand
+        self._pending = True
+        self._top = 0
+        self._rows = [0] * capacity
+        self._cols = [0] * capacity
+        self._values = [[] for _ in range(capacity)]
+        self._next = [0] * capacity
+        self._marks = [0] * capacity
+
+    def path(self) -> list[tuple[int, int, int]]:
+        """The (row, col, val) choices leading to the current node, shallowest first."""
+        return [
+            (self._rows[d], self._cols[d], self._values[d][self._next[d] - 1])
+            for d in range(self.depth)
+        ]
+
+    def split(self) -> list[list[tuple[int, int, int]]]:
+        """Give away the untried values of the shallowest frame that has any, as the
+        choices leading to each. This search skips them from then on, so another can
+        take them over. Only call it while run is paused."""
+        if self.solved is not None:
+            return []
+        for d in range(self._top):
+            values, k = self._values[d], self._next[d]
+            if k < len(values):
+                self._values[d] = values[:k]
+                prefix = self.path()[:d]
+                row, col = self._rows[d], self._cols[d]
+                return [[*prefix, (row, col, val)] for val in values[k:]]
+        return []
+
+    def run(self, budget: int | None = None) -> bool | None:
+        """Search until the state is solved (True) or every choice is exhausted (False).
+        With a budget, returns None after expanding that many nodes; calling run again
+        resumes the search."""
+        if self.solved is not None:
+            return self.solved
+        state, result, expand = self.state, self.result, self._expand
+        rows, cols, values, nexts, marks = (
+            self._rows,
+            self._cols,
+            self._values,
+            self._next,
+            self._marks,
+        )
+        trace = result.trace
+        depth, top, pending = self.depth, self._top, self._pending
+        expanded = 0
+        while True:
+            if pending:
+                if budget is not None and expanded >= budget:
+                    break
+                expanded += 1
+                result.enter(depth)
+                outcome = expand(state, result, depth)
+                pending = False
+                if outcome is True:
+                    self.solved = True
+                    break
+                if outcome is False:
+                    top = depth
+                else:
+                    rows[depth], cols[depth], values[depth] = outcome
+                    nexts[depth] = 0
+                    top = depth + 1
+
+            # Move on to the next value of the deepest frame, undoing the last one
+            d = top - 1
+            if d < 0:
+                self.solved = False
+                break
+            k = nexts[d]
+            row, col, vals = rows[d], cols[d], values[d]
+            if k > 0:
+                # Dead end. Put back everything this branch eliminated.
+                result.backtracks += 1
+                state.undo_to(marks[d])
+                if trace is not None:
+                    trace.backtrack(d, row, col, vals[k - 1])
+            if k == len(vals):
+                top = d
+                continue
+            nexts[d] = k + 1
+            marks[d] = state.mark()
+            state.constrain(row, col, vals[k])
+            if trace is not None:
+                trace.assign(d, row, col, vals[k])
+            depth = d + 1
+            pending = True
+
+        self.depth, self._top, self._pending = depth, top, pending
+        return self.solved
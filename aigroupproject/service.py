@@ -0,0 +1,296 @@
+# service.py
+import math
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+import bulk
+import legality
+
+SOLVED = bulk.SOLVED
+UNSOLVABLE = bulk.UNSOLVABLE
+INVALID = bulk.INVALID
+TIMEOUT = "timeout"
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+Grid = list[list[int]]
+# Status, solution and seconds spent solving, for one board
+Outcome = tuple[str, Grid | None, float]
+
+
+def parse_board(data: Any) -> Grid:
+    """A board from JSON: an 81 character string as bulk.py reads, or a list of rows
+    of any box size with 0 or null for empty cells. Raises ValueError if it is neither.
+    """
+    if isinstance(data, str):
+        return bulk.parse_puzzle(data)
+    if not isinstance(data, list) or not data:
+        raise ValueError("expected a puzzle string or a list of rows")
+    size = len(data)
+    if math.isqrt(size) ** 2 != size:
+        raise ValueError(f"{size} rows is not a square number")
+    grid: Grid = []
+    for row in data:
+        if not isinstance(row, list) or len(row) != size:
+            raise ValueError(f"every row must be a list of {size} values")
+        values = [0 if v is None else v for v in row]
+        if any(type(v) is not int or not 0 <= v <= size for v in values):
+            raise ValueError(f"values must be whole numbers from 0 to {size}")
+        grid.append(values)
+    return grid
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum: int, frame: object):
+    raise SolveTimeout
+
+
+def _init_worker():
+    """Runs once in every worker process. Solves an easy board with every solver, so
+    imports and per-size tables are built before the first request."""
+    _ = signal.signal(signal.SIGALRM, _raise_timeout)
+    board = bulk.parse_puzzle(
+        "53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79"
+    )
+    for solve in bulk.SOLVERS.values():
+        _ = solve([row[:] for row in board])
+
+
+def _solve_one(solve: bulk.Solve, grid: Grid, timeout: float) -> Outcome:
+    start_time = time.perf_counter()
+    # Not every solver copes with givens that already clash
+    if legality.first_bad_unit(grid, complete=False) is not None:
+        return UNSOLVABLE, None, 0.0
+    # A solve that runs past the timer is interrupted where it is, and its state dropped
+    _ = signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        solution = solve(grid).solution
+    except SolveTimeout:
+        return TIMEOUT, None, time.perf_counter() - start_time
+    finally:
+        _ = signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start_time
+    if solution is None:
+        return UNSOLVABLE, None, elapsed
+    return SOLVED, solution, elapsed
+
+
+def _solve_batch(solver_name: str, jobs: list[tuple[Grid, float]]) -> list[Outcome]:
+    """Solve a batch of (board, timeout) in a worker."""
+    solve = bulk.SOLVERS[solver_name]
+    return [_solve_one(solve, grid, timeout) for grid, timeout in jobs]
+
+
+class Histogram:
+    """Counts of observations at or below each bound, and above the last."""
+
+    bounds: tuple[float, ...]
+    counts: list[int]
+    count: int
+    total: float
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.bounds) and value > self.bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+
+    def to_dict(self) -> dict[str, Any]:
+        labels = [f"le_{b}" for b in self.bounds] + ["inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts, strict=True)),
+            "count": self.count,
+            "sum": self.total,
+        }
+
+
+@dataclass
+class _Job:
+    grid: Grid
+    solver_name: str
+    timeout: float
+    queued: float  # time.perf_counter() when it was submitted
+    future: Future[Outcome] = field(default_factory=Future)
+
+
+class SolveService:
+    """Solves boards in a pool of worker processes, so CPU-bound solves do not hold up
+    the threads serving requests.
+
+    Boards are queued and a dispatcher thread takes them off in batches: it waits up to
+    batch_wait seconds for more boards to join the first, or until max_batch are
+    waiting, then sends each solver's boards to a worker as one task. Only two batches
+    per worker are in flight at a time, so under load boards wait in the queue, where
+    they are coalesced into larger batches, rather than in the pool.
+    """
+
+    workers: int
+    batch_wait: float
+    max_batch: int
+    solve_timeout: float  # Longest a board may be solved for, in seconds
+    queue_timeout: float  # Longest solve_many waits for a board to start, in seconds
+    _queue: queue.Queue[_Job | None]
+    _slots: threading.Semaphore
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        batch_wait: float = 0.002,
+        max_batch: int = 64,
+        solve_timeout: float = 10.0,
+        queue_timeout: float = 30.0,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_wait = batch_wait
+        self.max_batch = max_batch
+        self.solve_timeout = solve_timeout
+        self.queue_timeout = queue_timeout
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(2 * self.workers)
+        self._lock = threading.Lock()
+        self._in_flight = 0  # Boards sent to workers and not back yet
+        self._statuses = {SOLVED: 0, UNSOLVABLE: 0, TIMEOUT: 0}
+        self._latency = Histogram(LATENCY_BUCKETS)  # Queued to answered
+        self._solve_time = Histogram(LATENCY_BUCKETS)  # Spent solving in a worker
+        self._batch_size = Histogram(BATCH_BUCKETS)
+
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        # The pool starts its processes on demand, so give every worker a task now
+        warmups = [
+            self._executor.submit(_solve_batch, "dlx", []) for _ in range(self.workers)
+        ]
+        for future in warmups:
+            _ = future.result()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(
+        self, grid: Grid, solver_name: str = "dlx", timeout: float | None = None
+    ) -> Future[Outcome]:
+        """Queue a board, getting a future of its status, solution and solve time. The
+        timeout is capped at solve_timeout."""
+        if solver_name not in bulk.SOLVERS:
+            raise ValueError(f"unknown solver {solver_name!r}")
+        timeout = min(timeout or self.solve_timeout, self.solve_timeout)
+        job = _Job(grid, solver_name, timeout, time.perf_counter())
+        self._queue.put(job)
+        return job.future
+
+    def solve(
+        self, grid: Grid, solver_name: str = "dlx", timeout: float | None = None
+    ) -> Outcome:
+        return self.solve_many([grid], solver_name, timeout)[0]
+
+    def solve_many(
+        self, grids: list[Grid], solver_name: str = "dlx", timeout: float | None = None
+    ) -> list[Outcome]:
+        """Solve boards, waiting for all of them. Boards not answered within
+        queue_timeout plus the solve timeout are dropped and reported as timeouts."""
+        futures = [self.submit(grid, solver_name, timeout) for grid in grids]
+        timeout = min(timeout or self.solve_timeout, self.solve_timeout)
+        deadline = time.monotonic() + self.queue_timeout + timeout
+        outcomes: list[Outcome] = []
+        for future in futures:
+            try:
+                outcomes.append(future.result(max(deadline - time.monotonic(), 0)))
+            except TimeoutError:
+                _ = future.cancel()
+                outcomes.append((TIMEOUT, None, 0.0))
+        return outcomes
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)
+                    break
+                batch.append(job)
+
+            # Jobs given up on while queued are left out
+            batch = [job for job in batch if job.future.set_running_or_notify_cancel()]
+            by_solver: dict[str, list[_Job]] = {}
+            for job in batch:
+                by_solver.setdefault(job.solver_name, []).append(job)
+            if not by_solver:
+                self._slots.release()
+            for i, (solver_name, jobs) in enumerate(by_solver.items()):
+                # The slot taken above covers the first task; take one for each other
+                if i > 0:
+                    self._slots.acquire()
+                self._send(solver_name, jobs)
+
+    def _send(self, solver_name: str, jobs: list[_Job]):
+        with self._lock:
+            self._in_flight += len(jobs)
+            self._batch_size.observe(len(jobs))
+        task = self._executor.submit(
+            _solve_batch, solver_name, [(job.grid, job.timeout) for job in jobs]
+        )
+        task.add_done_callback(lambda task: self._finish(jobs, task))
+
+    def _finish(self, jobs: list[_Job], task: Future[list[Outcome]]):
+        self._slots.release()
+        try:
+            outcomes = task.result()
+        except Exception as e:
+            with self._lock:
+                self._in_flight -= len(jobs)
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        now = time.perf_counter()
+        with self._lock:
+            self._in_flight -= len(jobs)
+            for job, (status, _, elapsed) in zip(jobs, outcomes, strict=True):
+                self._statuses[status] += 1
+                self._latency.observe((now - job.queued) * 1000)
+                self._solve_time.observe(elapsed * 1000)
+        for job, outcome in zip(jobs, outcomes, strict=True):
+            job.future.set_result(outcome)
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "boards": dict(self._statuses),
+                "latency_ms": self._latency.to_dict(),
+                "solve_ms": self._solve_time.to_dict(),
+                "batch_size": self._batch_size.to_dict(),
+            }
+
+    def close(self):
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,184 @@
+# solution_cache.py
+import functools
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any, TypeVar, cast
+
+import canonical
+import utils
+
+Grid = list[list[int]]
+Key = tuple[int, ...]  # A board read row by row
+F = TypeVar("F", bound=Callable[..., utils.SolveResult])
+
+VERSION = 1
+
+
+def _flatten(grid: Grid) -> Key:
+    return tuple(v for row in grid for v in row)
+
+
+def _unflatten(cells: Key) -> Grid:
+    size = math.isqrt(len(cells))
+    return [list(cells[r * size : r * size + size]) for r in range(size)]
+
+
+class SolutionCache:
+    """Least recently used cache of solutions keyed by canonical puzzle form, so a
+    puzzle is solved once however its digits are relabelled, its rows and columns
+    permuted or the board transposed.
+
+    Solutions are stored in canonical form and mapped back through the transform of
+    the puzzle being looked up. The canonical form of the last maxsize puzzles is
+    also kept, so an exact repeat does not pay for canonical_form again.
+    """
+
+    maxsize: int
+    path: str | None  # File the cache is loaded from and saved to
+    hits: int
+    misses: int
+    evictions: int
+    _solutions: OrderedDict[Key, Key]  # canonical puzzle -> canonical solution
+    _forms: OrderedDict[Key, tuple[Key, canonical.Transform]]  # puzzle -> its form
+
+    def __init__(self, maxsize: int = 10000, path: str | None = None) -> None:
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._solutions = OrderedDict()
+        self._forms = OrderedDict()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._solutions)
+
+    def _canonical_form(self, grid: Grid) -> tuple[Key, canonical.Transform]:
+        puzzle = _flatten(grid)
+        form = self._forms.get(puzzle)
+        if form is None:
+            form = canonical.canonical_form(grid)
+            self._forms[puzzle] = form
+            if len(self._forms) > self.maxsize:
+                _ = self._forms.popitem(last=False)
+        else:
+            self._forms.move_to_end(puzzle)
+        return form
+
+    def _get(self, key: Key, transform: canonical.Transform) -> Grid | None:
+        solution = self._solutions.get(key)
+        if solution is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._solutions.move_to_end(key)
+        return transform.invert(_unflatten(solution))
+
+    def _put(self, key: Key, solution: Key):
+        self._solutions[key] = solution
+        self._solutions.move_to_end(key)
+        while len(self._solutions) > self.maxsize:
+            _ = self._solutions.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, grid: Grid) -> Grid | None:
+        """The stored solution of the puzzle or one equivalent to it, if any."""
+        return self._get(*self._canonical_form(grid))
+
+    def put(self, grid: Grid, solution: Grid):
+        key, transform = self._canonical_form(grid)
+        self._put(key, _flatten(transform.apply(solution)))
+
+    def solve(
+        self,
+        solve: Callable[[Grid], utils.SolveResult],
+        grid: Grid,
+        in_place: bool = False,
+    ) -> utils.SolveResult:
+        """Look the puzzle up, and only call solve on a miss. in_place copies a cached
+        solution into grid, for solvers that fill the board in."""
+        start_time = time.perf_counter()
+        # Before solving, since in place solvers overwrite the puzzle
+        key, transform = self._canonical_form(grid)
+        solution = self._get(key, transform)
+        if solution is None:
+            result = solve(grid)
+            if result.solution is not None:
+                self._put(key, _flatten(transform.apply(result.solution)))
+            return result
+        if in_place:
+            for row, solved in zip(grid, solution, strict=True):
+                row[:] = solved
+            solution = grid
+        return utils.SolveResult(solution, elapsed=time.perf_counter() - start_time)
+
+    def save(self, path: str | None = None):
+        """Write the solutions, oldest first, as JSON to path or the cache's file."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("no file to save the solution cache to")
+        with open(path, "w") as f:
+            json.dump({"version": VERSION, "solutions": list(self._solutions.items())}, f)
+
+    def load(self, path: str):
+        """Add the solutions saved in a file, as the most recently used."""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} solution cache")
+        for key, solution in data["solutions"]:
+            self._put(tuple(key), tuple(solution))
+
+    def format_stats(self) -> str:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({rate:.1%} hit rate), "
+            f"{self.evictions} evictions, {len(self)}/{self.maxsize} solutions cached"
+        )
+
+
+# The cache the @cached solver entry points use, if enabled
+_active: SolutionCache | None = None
+
+
+def enable(maxsize: int = 10000, path: str | None = None) -> SolutionCache:
+    """Put a cache in front of every @cached solver, loading path if it exists."""
+    global _active
+    _active = SolutionCache(maxsize, path)
+    return _active
+
+
+def disable():
+    """Stop caching, saving the cache first if it has a file."""
+    global _active
+    if _active is not None and _active.path is not None:
+        _active.save()
+    _active = None
+
+
+def active() -> SolutionCache | None:
+    return _active
+
+
+def cached(in_place: bool = False) -> Callable[[F], F]:
+    """Decorator for solver entry points that take the grid first. While a cache is
+    enabled, puzzles it has seen (or an equivalent of) are answered from it; otherwise
+    it is a single check per call."""
+
+    def decorate(solve: F) -> F:
+        @functools.wraps(solve)
+        def wrapper(grid: Grid, *args: Any, **kwargs: Any) -> utils.SolveResult:
+            if _active is None:
+                return solve(grid, *args, **kwargs)
+            return _active.solve(lambda g: solve(g, *args, **kwargs), grid, in_place)
+
+        return cast(F, wrapper)
+
+    return decorate
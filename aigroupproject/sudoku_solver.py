@@ -1,129 +1,209 @@
 # sudoku_solver.py
+import argparse
+import math
 import time
 
+import bitboard
 import cli
+import search
+import solution_cache
 import sudoku_solver as solver
+import utils
 # import tests
 
 
 def format_board(grid: list[list[int | None]]) -> list[list[int]]:
     """Replace the None values in the grid with 0's"""
-    cols: list[list[int]] = []
-    for i in range(9):
-        row = []
-        for j in range(9):
-            elem = grid[i][j] if grid[i][j] is not None else 0
-            row.append(elem)
-        cols.append(row)
-    return cols
+    return [[elem if elem is not None else 0 for elem in row] for row in grid]
 
 
 def is_valid(board: list[list[int]], row: int, col: int, num: int) -> bool:
-    """Checks if the input 'num, can be added to the board"""
-
-    for i in range(9):
+    """Checks if the input 'num, can be added to the board. Scans the row, column and
+    box; solvers use Occupancy.is_valid instead."""
+    n = math.isqrt(len(board))
+    for i in range(n * n):
         if board[row][i] == num or board[i][col] == num:
             return False
-    start_row, start_col = row - row % 3, col - col % 3
-    for i in range(3):
-        for j in range(3):
+    start_row, start_col = row - row % n, col - col % n
+    for i in range(n):
+        for j in range(n):
             if board[i + start_row][j + start_col] == num:
                 return False
     return True
 
 
-#least available valid number is stored and sent to most constraining variable
-def most_constrained_variables(board: list[list[int]]) -> list[tuple[int, int]]:
+class Occupancy:
+    """The digits placed in every row, column and box of a board as bitmasks.
+
+    Bit ``v - 1`` of a mask means ``v`` is already in that unit. assign and unassign
+    write the board and keep the masks in step, so checking a digit is O(1) instead of
+    a scan of the row, column and box. constrain, mark and undo_to do the same with a
+    trail of the cells assigned, for search.Search.
+    """
+
+    board: list[list[int]]
+    n: int
+    size: int  # n * n, the side of the board
+    full: int  # Mask with every digit
+    rows: list[int]
+    cols: list[int]
+    boxes: list[int]
+    trail: list[tuple[int, int]]  # (row, col) of the cells constrain assigned, in order
+
+    def __init__(self, board: list[list[int]]) -> None:
+        self.board = board
+        self.size = len(board)
+        self.n = math.isqrt(self.size)
+        self.full = (1 << self.size) - 1
+        self.rows = [0] * self.size
+        self.cols = [0] * self.size
+        self.boxes = [0] * self.size
+        self.trail = []
+        for row in range(self.size):
+            for col in range(self.size):
+                num = board[row][col]
+                if num != 0:
+                    bit = 1 << (num - 1)
+                    self.rows[row] |= bit
+                    self.cols[col] |= bit
+                    self.boxes[self.box(row, col)] |= bit
+
+    def box(self, row: int, col: int) -> int:
+        return (row // self.n) * self.n + col // self.n
+
+    def candidates(self, row: int, col: int) -> int:
+        """Mask of the digits that can go in the cell."""
+        used = self.rows[row] | self.cols[col] | self.boxes[self.box(row, col)]
+        return self.full & ~used
+
+    def is_valid(self, row: int, col: int, num: int) -> bool:
+        return self.candidates(row, col) >> (num - 1) & 1 == 1
+
+    def assign(self, row: int, col: int, num: int):
+        bit = 1 << (num - 1)
+        self.board[row][col] = num
+        self.rows[row] |= bit
+        self.cols[col] |= bit
+        self.boxes[self.box(row, col)] |= bit
+
+    def unassign(self, row: int, col: int):
+        bit = ~(1 << (self.board[row][col] - 1))
+        self.board[row][col] = 0
+        self.rows[row] &= bit
+        self.cols[col] &= bit
+        self.boxes[self.box(row, col)] &= bit
+
+    def constrain(self, row: int, col: int, val: int):
+        self.assign(row, col, val)
+        self.trail.append((row, col))
+
+    def mark(self) -> int:
+        """Current position in the trail, to pass to undo_to later."""
+        return len(self.trail)
+
+    def undo_to(self, mark: int):
+        """Unassign every cell constrain assigned since mark was taken."""
+        trail = self.trail
+        while len(trail) > mark:
+            self.unassign(*trail.pop())
+
+
+# least available valid number is stored and sent to most constraining variable
+@utils.RT.hot_path
+def most_constrained_variables(occupancy: Occupancy) -> list[tuple[int, int]]:
+    board = occupancy.board
     tied_cells: list[tuple[int, int]] = []
-    min_valid_values = 10  # Start with a value larger than the max (9)
+    min_valid_values = occupancy.size + 1  # Start with a value larger than the max
 
-    for r in range(9):
-        for c in range(9):
-            # print("checking ---> ",board[r][c])
+    for r in range(occupancy.size):
+        for c in range(occupancy.size):
             if board[r][c] == 0:
-                # print("zero---> ",board[r][c])
-                valid_values = [
-                    num for num in range(1, 10) if is_valid(board, r, c, num)
-                ]
-                print((r,c),valid_values, len(valid_values), min_valid_values) 
-                if len(valid_values) == min_valid_values:
+                valid_values = occupancy.candidates(r, c).bit_count()
+                if valid_values == min_valid_values:
                     # ties are allowed, if two cells are equally constrained
-                    print("this will print",(r,c), valid_values, min_valid_values)
                     tied_cells.append((r, c))
-                    
-                elif len(valid_values) < min_valid_values:
-                    min_valid_values = len(valid_values)
+                elif valid_values < min_valid_values:
+                    min_valid_values = valid_values
                     # remove old cells, since this cell is more constrined.
-                    print("this line of code is working",(r,c), valid_values, min_valid_values)
                     tied_cells = [(r, c)]
-    print("this code is working")
-    print(tied_cells, min_valid_values)
     return tied_cells
 
 
+@utils.RT.hot_path
 def most_constraining_variable(
-    board: list[list[int]], tied_cells: list[tuple[int, int]]
+    occupancy: Occupancy, tied_cells: list[tuple[int, int]]
 ) -> tuple[int, int]:
     """From a list of tied cells, find the cell that imposes the most constraints on its
     neighbors. if there is a tie, return random of the maxs"""
+    board, n = occupancy.board, occupancy.n
     max_constraints = -1
     most_constraining_cell = tied_cells[0]
-    # print("most constraining cell:", most_constraining_cell)
 
     for r, c in tied_cells:
         constraints = 0
-        # print("the row and colm: ", r,c)
         # counting unassigned cells in the same row and column
-        for i in range(9):
+        for i in range(occupancy.size):
             if board[r][i] == 0:
                 constraints += 1
             if board[i][c] == 0:
                 constraints += 1
 
         # counting unassigned cells in the subgrid
-        start_row, start_col = 3 * (r // 3), 3 * (c // 3)
-        for i in range(start_row, start_row + 3):
-            for j in range(start_col, start_col + 3):
-                # print("sub board--->", board[i][j])
+        start_row, start_col = n * (r // n), n * (c // n)
+        for i in range(start_row, start_row + n):
+            for j in range(start_col, start_col + n):
                 if board[i][j] == 0:
                     constraints += 1
-        # print("most constraining:", constraints)
         # updating the most constraining variable
         if constraints > max_constraints:
             max_constraints = constraints
             most_constraining_cell = (r, c)
-            # print("new most constrininig: ", r,c, max_constraints)
-    # print("--->most constraining cell", most_constraining_cell)
     return most_constraining_cell
 
 
-def least_constraining_values(board: list[list[int]], row: int, col: int) -> list[int]:
+@utils.RT.hot_path
+def least_constraining_values(occupancy: Occupancy, row: int, col: int) -> list[int]:
     """Get the possible values of a cell, ordered by their least constraining effect"""
+    board = occupancy.board
     candidates: list[tuple[int, int]] = []
-    for num in range(1, 10):
-        if is_valid(board, row, col, num):
-            # counting how many other cells this value would restrict
-            constraint_count = 0
-            for r in range(9):
-                if board[r][col] == 0 and is_valid(board, r, col, num):
-                    constraint_count += 1
-            for c in range(9):
-                if board[row][c] == 0 and is_valid(board, row, c, num):
-                    constraint_count += 1
-            
-            candidates.append((num, constraint_count))
+    for num in bitboard.mask_to_values(occupancy.candidates(row, col)):
+        # counting how many other cells this value would restrict
+        constraint_count = 0
+        for r in range(occupancy.size):
+            if board[r][col] == 0 and occupancy.is_valid(r, col, num):
+                constraint_count += 1
+        for c in range(occupancy.size):
+            if board[row][c] == 0 and occupancy.is_valid(row, c, num):
+                constraint_count += 1
+
+        candidates.append((num, constraint_count))
 
     # Sort by the number of constraints (ascending)
-    # print("---->candidates before:", candidates)
     candidates.sort(key=lambda x: x[1])
-    # print("---->candidates after:", candidates)
-    print(candidates[0])
     return [x[0] for x in candidates]
 
 
-def solve_heuristics(board: list[list[int]]) -> bool:
+@solution_cache.cached(in_place=True)
+def solve_heuristics(
+    board: list[list[int]], trace: utils.Trace | None = None
+) -> utils.SolveResult:
+    """Solve board in place with MRV, MCV and LCV. Any n * n by n * n board. Pass a
+    Trace to record the search."""
+    result = utils.SolveResult(trace=trace)
+    start_time = time.perf_counter()
+    occupancy = Occupancy(board)
+    if search.Search(occupancy, _expand, result, occupancy.size**2).run():
+        result.solution = board
+    result.elapsed = time.perf_counter() - start_time
+    return result
+
+
+@utils.RT.hot_path
+def _expand(
+    occupancy: Occupancy, result: utils.SolveResult, depth: int
+) -> search.Branch | bool:
     # Finding the most constrained variable(s)
-    tied_cells: list[tuple[int, int]] = most_constrained_variables(board)
+    tied_cells: list[tuple[int, int]] = most_constrained_variables(occupancy)
 
     # If the board is solved
     if not tied_cells:
@@ -131,27 +211,23 @@ def solve_heuristics(board: list[list[int]]) -> bool:
 
     # If there's a tie, use Most Constraining Variable to break it
     if len(tied_cells) > 1:
-        row, col = most_constraining_variable(board, tied_cells)
+        row, col = most_constraining_variable(occupancy, tied_cells)
     else:
         row, col = tied_cells[0]
 
     # trying the least constraining values for the selected cell
-    for num in least_constraining_values(board, row, col):
-        board[row][col] = num
-        # print(f"Trying {num} at ({row}, {col})")
-        if solve_heuristics(board):
-            return True
-        board[row][col] = 0
-        # print(f"Backtracking at ({row}, {col})")
-
-    return False
-
-
-def main(board: list[list[int]]):
-    start_time = time.time()
-    if solver.solve_heuristics(board):
-        end_time = time.time()
-        print(f"Heuristic solving time: {end_time - start_time:.6f} seconds.")
+    return row, col, least_constraining_values(occupancy, row, col)
+
+
+def main(board: list[list[int]], trace_path: str | None = None):
+    trace = utils.Trace(board)
+    result = solver.solve_heuristics(board, trace if trace_path is not None else None)
+    if trace_path is not None:
+        trace.dump(trace_path)
+        print(f"Wrote {len(trace)} search events to {trace_path}")
+    if result:
+        print(f"Heuristic solving time: {result.elapsed:.6f} seconds.")
+        print(f"Search: {result.format_stats()}")
         # print("Solution Found. Testing for accuracy...")
         # if tests.is_board_solved(board):
         #     print("Solution is solved and legal.")
@@ -159,14 +235,34 @@ def main(board: list[list[int]]):
         #     print("Solution is not legal")
 
         print("\nSolved Sudoku board:")
-        result = cli.format_board_ascii(board)
-        print(result)
+        print(cli.format_board_ascii(board))
     else:
         print("No solution exists.")
 
 
+def replay(trace_path: str):
+    """Print the board after every event of a recorded search."""
+    for (kind, depth, row, col, val), board in utils.Trace.load(trace_path).replay():
+        print(f"{kind} {val} at ({row}, {col}), depth {depth}")
+        print(cli.format_board_ascii(board))
+
+
 if __name__ == "__main__":
-    puzzle = cli.get_puzzle()
-    puzzle.show()
-    board = solver.format_board(puzzle.board)
-    main(board)
+    parser = argparse.ArgumentParser(description="Solve a Sudoku with MRV, MCV and LCV.")
+    _ = parser.add_argument(
+        "--trace", default=None, help="Record the search to this file"
+    )
+    _ = parser.add_argument(
+        "--replay",
+        default=None,
+        help="Print the boards of a recorded search instead of solving",
+    )
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        replay(args.replay)
+    else:
+        puzzle = cli.get_puzzle()
+        puzzle.show()
+        board = solver.format_board(puzzle.board)
+        main(board, args.trace)
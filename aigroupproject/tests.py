@@ -1,25 +1,48 @@
 # tests.py
 import argparse
+import math
+import os
 import random
 import time
+from collections.abc import Callable
 from concurrent.futures import ProcessPoolExecutor
 
 import brute_force as bf
 import cli as cli
+import corpus
+import dlx
+import generator
+import legality
 import lookup_table as tbl
 import sudoku_solver as solver
-from sudoku import Sudoku
+import utils
 
+Solver = Callable[[list[list[int]]], utils.SolveResult]
 
-def test_single_board(lookup_table: bool = False, brute_force: bool = False):
-    """Test a single sudoku board."""
-    board = get_random_board()
+
+def select_solver(
+    lookup_table: bool = False, brute_force: bool = False, dancing_links: bool = False
+) -> Solver:
+    """The solve function for the chosen method."""
     if lookup_table:
-        success = tbl.solve_heuristics_root(board)
-    elif brute_force:
-        success = bf.brute_force(board)
-    else:
-        success = solver.solve_heuristics(board)
+        return tbl.solve_heuristics_root
+    if brute_force:
+        return bf.brute_force
+    if dancing_links:
+        return dlx.solve
+    return solver.solve_heuristics
+
+
+def test_single_board(
+    lookup_table: bool = False,
+    brute_force: bool = False,
+    dancing_links: bool = False,
+    board: list[list[int]] | None = None,
+):
+    """Test a single sudoku board, a freshly generated one if none is given."""
+    if board is None:
+        board = get_random_board()
+    success = select_solver(lookup_table, brute_force, dancing_links)(board)
     if not success:
         print("Failed Test")
         print(cli.format_board_ascii(board))
@@ -29,14 +52,89 @@ def test_single_board(lookup_table: bool = False, brute_force: bool = False):
 
 def get_random_board() -> list[list[int]]:
     """Generate a random board."""
-    d = random.uniform(0, 1)
-    x = Sudoku(3).difficulty(d).board
-    return solver.format_board(x)
+    return generator.puzzle(seed=random.random(), difficulty=random.uniform(0, 1))
+
+
+# Set in each worker process by _init_worker
+_worker_solver: Solver | None = None
+
+
+def _init_worker(solve: Solver, profile: bool = False):
+    """Runs once in every worker process. Keeps the solver for _solve_chunk and solves
+    an easy board, so imports and per-size tables are built before the timed work."""
+    global _worker_solver
+    _worker_solver = solve
+    _ = solve(generator.puzzle(seed=0, difficulty=0.1))
+    if profile:
+        utils.RT.enable()
 
 
-def run_single_test(lookup_table: bool = False, brute_force: bool = False):
-    """Helper function to run a single test in parallel."""
-    return test_single_board(lookup_table, brute_force)
+def _solve_chunk(
+    boards: list[list[list[int]]],
+) -> tuple[list[list[list[int]]], float, dict[str, dict[str, float]]]:
+    """Solve a chunk of boards in a worker. Returns the boards that failed, as they were
+    before solving, the time spent solving and the profiling stats of the chunk."""
+    assert _worker_solver is not None
+    utils.RT.reset()
+    failed: list[list[list[int]]] = []
+    start_time = time.perf_counter()
+    for board in boards:
+        original = [row[:] for row in board]
+        if not _worker_solver(board):
+            failed.append(original)
+    return failed, time.perf_counter() - start_time, utils.RT.snapshot()
+
+
+def test_many_boards_parallel(
+    epoch: int,
+    solve: Solver,
+    workers: int | None = None,
+    chunksize: int | None = None,
+    corpus_path: str | None = None,
+    profile: bool = False,
+) -> tuple[float, int]:
+    """Solve epoch pre-generated boards across worker processes.
+
+    Boards are sent in chunks, so there is one round trip per chunk instead of per
+    board. By default there are about four chunks per worker, which keeps the workers
+    evenly loaded when some boards are much harder than others. The boards come from
+    the corpus file if there is one. Returns the boards per second and the number of
+    failures. With profile, the hot-path stats of every worker are merged into
+    utils.RT.
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, math.ceil(epoch / (workers * 4)))
+    if corpus_path is None:
+        boards = [get_random_board() for _ in range(epoch)]
+    else:
+        boards = corpus.load_boards(epoch, corpus_path)
+    chunks = [boards[i : i + chunksize] for i in range(0, epoch, chunksize)]
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(solve, profile)
+    ) as executor:
+        results = list(executor.map(_solve_chunk, chunks))
+    wall_time = time.perf_counter() - start_time
+
+    failed = [board for chunk_failed, _, _ in results for board in chunk_failed]
+    busy_time = sum(elapsed for _, elapsed, _ in results)
+    for _, _, stats in results:
+        utils.RT.merge(stats)
+    for board in failed[:3]:
+        print("Failed Test")
+        print(cli.format_board_ascii(board))
+    print(
+        f"{epoch - len(failed)}/{epoch} boards solved by {workers} workers in "
+        f"{len(chunks)} chunks of up to {chunksize}"
+    )
+    print(
+        f"Wall time {wall_time:.3f}s ({epoch / wall_time:.1f} boards/sec), "
+        f"solving time {busy_time:.3f}s ({busy_time / wall_time / workers:.0%} "
+        "worker utilization)"
+    )
+    return epoch / wall_time, len(failed)
 
 
 def test_many_boards(
@@ -45,85 +143,70 @@ def test_many_boards(
     lookup_table: bool = False,
     brute_force: bool = False,
     verbose: bool = False,
+    dancing_links: bool = False,
+    workers: int | None = None,
+    chunksize: int | None = None,
+    corpus_path: str | None = None,
+    profile: str | None = None,
 ):
-    """Run tests on multiple boards (batch)."""
+    """Run tests on multiple boards (batch). With a corpus file the boards are read
+    from it instead of generated. profile is "table" or "json" to print the hot-path
+    stats at the end."""
     print(f"Testing {epoch} test batch")
 
-    start_time = time.time()
+    utils.RT.reset()
     if parallel:
-        with ProcessPoolExecutor() as executor:
-            results = list(executor.map(run_single_test, range(epoch)))
-        failed_tests = sum(1 for result in results if not result)
+        solve = select_solver(lookup_table, brute_force, dancing_links)
+        _, failed_tests = test_many_boards_parallel(
+            epoch, solve, workers, chunksize, corpus_path, profile is not None
+        )
         if failed_tests > 0:
             print(f"Tests failed: {failed_tests}")
         else:
             print(f"Successfully passed {epoch} tests.")
+        _print_profile(profile)
+        return
+
+    boards = corpus.Corpus(corpus_path) if corpus_path is not None else None
+    if boards is not None and epoch > len(boards):
+        raise ValueError(f"{corpus_path} only has {len(boards)} boards")
+    if profile is not None:
+        utils.RT.enable()
+    start_time = time.time()
+    for i in range(epoch):
+        if verbose and i % 10 == 0 and i != 0:
+            print(f"{i} tests complete...")
+        board = boards[i] if boards is not None else None
+        if not test_single_board(lookup_table, brute_force, dancing_links, board):
+            print("Test failed")
+            break
     else:
-        for i in range(epoch):
-            if verbose and i % 10 == 0 and i != 0:
-                print(f"{i} tests complete...")
-            if not test_single_board(lookup_table, brute_force):
-                print("Test failed")
-                break
-        else:
-            print(f"Successfully passed {epoch} tests.")
+        print(f"Successfully passed {epoch} tests.")
     end_time = time.time()
+    utils.RT.disable()
     print(f"Heuristic solving time: {end_time - start_time:.6f} seconds.")
+    _print_profile(profile)
 
 
-def is_board_legal(board: list[list[int]]) -> bool:
-    def is_subgrid_legal(start_row: int, start_col: int):
-        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-        for r in range(3):
-            for c in range(3):
-                cell_value = board[r + start_row][c + start_col]
-                if cell_value in digits:
-                    digits.remove(cell_value)
-        return not len(digits)
-
-    # Check rows
-    for row in board:
-        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-        for cell in row:
-            if cell in digits:
-                digits.remove(cell)
-            elif cell == 0:
-                continue
-            else:
-                return False
-
-    # Check columns
-    for col_idx in range(9):
-        digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-        for row in board:
-            cell = row[col_idx]
-            if cell in digits:
-                digits.remove(cell)
-            elif cell == 0:
-                continue  # Skip empty cells
-            else:
-                return False  # Duplicate value in the column
-
-    # Check each Subgrid
-    for r in range(0, 7, 3):
-        for c in range(0, 7, 3):
-            if not is_subgrid_legal(r, c):
-                return False
+def _print_profile(profile: str | None):
+    if profile == "table":
+        print(utils.RT.format_table())
+    elif profile == "json":
+        print(utils.RT.to_json())
 
-    return True
+
+def is_board_legal(board: list[list[int]]) -> bool:
+    """No row, column or box repeats a digit. Empty cells are allowed. Any board size."""
+    return legality.first_bad_unit(board, complete=False) is None
 
 
 def is_board_complete(board: list[list[int]]) -> bool:
-    digits = [1, 2, 3, 4, 5, 6, 7, 8, 9]
-    for row in board:
-        for cell in row:
-            if cell not in digits:
-                return False
-    return True
+    size = len(board)
+    return all(0 < cell <= size for row in board for cell in row)
 
 
 def is_board_solved(board: list[list[int]]) -> bool:
-    return is_board_legal(board) and is_board_complete(board)
+    return legality.first_bad_unit(board) is None
 
 
 def main():
@@ -152,6 +235,12 @@ def main():
         action="store_true",  # This flag doesn't need a value; it's a toggle
         help="Run the tests with the brute force algorithm",
     )
+    parser.add_argument(
+        "-dlx",
+        "--dancing_links",
+        action="store_true",  # This flag doesn't need a value; it's a toggle
+        help="Run the tests with the Dancing Links exact cover solver",
+    )
 
     parser.add_argument(
         "-v",
@@ -166,6 +255,30 @@ def main():
         action="store_true",  # This flag doesn't need a value; it's a toggle
         help="Run the tests in parallel",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for --parallel (default is one per CPU)",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["table", "json"],
+        default=None,
+        help="Time the solver hot paths and print the stats as a table or JSON",
+    )
+    parser.add_argument(
+        "--corpus",
+        default=None,
+        help="Read the boards from this corpus file instead of generating them",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Boards sent to a worker at a time (default is about 4 chunks per worker)",
+    )
 
     args = parser.parse_args()
 
@@ -176,6 +289,11 @@ def main():
         lookup_table=args.lookup_table,
         brute_force=args.brute_force,
         verbose=args.verbose,
+        dancing_links=args.dancing_links,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        corpus_path=args.corpus,
+        profile=args.profile,
     )
 
 
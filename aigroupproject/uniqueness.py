@@ -0,0 +1,102 @@
+# uniqueness.py
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import corpus
+import dlx
+import numpy as np
+
+NONE = 0
+UNIQUE = 1
+
+
+def _count_range(path: str, start: int, stop: int, limit: int) -> np.ndarray:
+    """Solution counts of boards start to stop of a corpus file."""
+    boards = corpus.Corpus(path)
+    size = boards.n * boards.n
+    grids = np.asarray(boards.boards[start:stop]).reshape(-1, size, size).tolist()
+    return np.array([dlx.count_solutions(g, limit) for g in grids], dtype=np.int64)
+
+
+def count_corpus(
+    path: str, limit: int = 2, workers: int = 0, chunksize: int = 256
+) -> np.ndarray:
+    """Solution count of every board in a corpus file, each capped at limit.
+
+    With no workers the boards are counted in this process. Otherwise every worker maps
+    the file itself and counts a range of chunksize boards, so only the counts are sent
+    back.
+    """
+    total = len(corpus.Corpus(path))
+    starts = range(0, total, chunksize)
+    if workers <= 0:
+        parts = [_count_range(path, s, s + chunksize, limit) for s in starts]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            parts = list(
+                executor.map(
+                    _count_range,
+                    [path] * len(starts),
+                    starts,
+                    [s + chunksize for s in starts],
+                    [limit] * len(starts),
+                )
+            )
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def main(path: str, limit: int, workers: int, chunksize: int, show: int):
+    start_time = time.time()
+    counts = count_corpus(path, limit, workers, chunksize)
+    elapsed = time.time() - start_time
+
+    total = len(counts)
+    unique = int(np.count_nonzero(counts == UNIQUE))
+    none = np.flatnonzero(counts == NONE)
+    multiple = np.flatnonzero(counts > UNIQUE)
+    print(
+        f"Checked {total} boards in {elapsed:.3f} seconds "
+        f"({total / max(elapsed, 1e-9):.1f} boards/sec)."
+    )
+    print(
+        f"{unique} unique, {len(multiple)} with several solutions, "
+        f"{len(none)} with no solution"
+    )
+    for label, indices in (("Several solutions", multiple), ("No solution", none)):
+        if len(indices):
+            shown = ", ".join(str(i) for i in indices[:show])
+            more = f" and {len(indices) - show} more" if len(indices) > show else ""
+            print(f"{label}: boards {shown}{more}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that every puzzle in a corpus file has exactly one solution."
+    )
+    _ = parser.add_argument("path", help="Corpus file to check")
+    _ = parser.add_argument(
+        "--limit",
+        type=int,
+        default=2,
+        help="Stop counting a board's solutions here (default is 2)",
+    )
+    _ = parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes, 0 to count in this process (default is one per CPU)",
+    )
+    _ = parser.add_argument(
+        "--chunksize", type=int, default=256, help="Boards per worker task"
+    )
+    _ = parser.add_argument(
+        "--show", type=int, default=10, help="Board indices to list per problem"
+    )
+    args = parser.parse_args()
+    if args.limit < 1:
+        parser.error("--limit must be at least 1")
+
+    main(args.path, args.limit, args.workers, args.chunksize, args.show)
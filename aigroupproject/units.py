@@ -0,0 +1,123 @@
+# units.py
+import argparse
+import timeit
+from functools import cache
+
+
+@cache
+def cell_units(n: int) -> tuple[tuple[int, int, int], ...]:
+    """(row, col, box) of every flat cell index for a board with subgrid size n."""
+    n_squared = n * n
+    units: list[tuple[int, int, int]] = []
+    for r in range(n_squared):
+        for c in range(n_squared):
+            units.append((r, c, (r // n) * n + c // n))
+    return tuple(units)
+
+
+@cache
+def unit_cells(n: int) -> tuple[tuple[tuple[int, ...], ...], ...]:
+    """Flat cell indices of every row, every column and every box, in that order."""
+    n_squared = n * n
+    rows = tuple(
+        tuple(r * n_squared + c for c in range(n_squared)) for r in range(n_squared)
+    )
+    cols = tuple(
+        tuple(r * n_squared + c for r in range(n_squared)) for c in range(n_squared)
+    )
+    boxes = tuple(
+        tuple((br + i) * n_squared + bc + j for i in range(n) for j in range(n))
+        for br in range(0, n_squared, n)
+        for bc in range(0, n_squared, n)
+    )
+    return rows, cols, boxes
+
+
+@cache
+def cell_peers(n: int) -> tuple[tuple[int, ...], ...]:
+    """Flat indices of the cells sharing a row, column or box with each cell, excluding
+    the cell itself. Each peer appears once."""
+    rows, cols, boxes = unit_cells(n)
+    peers: list[tuple[int, ...]] = []
+    for i, (r, c, b) in enumerate(cell_units(n)):
+        peers.append(tuple(sorted(set(rows[r] + cols[c] + boxes[b]) - {i})))
+    return tuple(peers)
+
+
+def _visit_peers_arithmetic(cells: list[set[int]], n: int, row: int, col: int) -> int:
+    # The row/column/box walk State.constrain used to do for every call.
+    n_squared = n * n
+    found = 0
+    for i in range(n_squared):
+        if 1 in cells[row * n_squared + i]:
+            found += 1
+        if 1 in cells[i * n_squared + col]:
+            found += 1
+    start_row, start_col = row - row % n, col - col % n
+    for i in range(n):
+        for j in range(n):
+            if 1 in cells[(i + start_row) * n_squared + j + start_col]:
+                found += 1
+    return found
+
+
+def _visit_peers_table(cells: list[set[int]], peers: tuple[int, ...]) -> int:
+    found = 0
+    for p in peers:
+        if 1 in cells[p]:
+            found += 1
+    return found
+
+
+def benchmark(n: int, number: int = 200) -> tuple[float, float]:
+    """Time one peer sweep of a cell, with coordinate arithmetic and with the peer
+    table. Returns the (arithmetic, table) cost per call in seconds, averaged over
+    every cell of the board."""
+    n_squared = n * n
+    cells = [set(range(1, n_squared + 1)) for _ in range(n_squared * n_squared)]
+    peers = cell_peers(n)
+    coords = [(r, c) for r, c, _ in cell_units(n)]
+
+    def arithmetic():
+        for r, c in coords:
+            _visit_peers_arithmetic(cells, n, r, c)
+
+    def table():
+        for i in range(len(coords)):
+            _visit_peers_table(cells, peers[i])
+
+    per_call = number * len(coords)
+    return (
+        timeit.timeit(arithmetic, number=number) / per_call,
+        timeit.timeit(table, number=number) / per_call,
+    )
+
+
+def main(sizes: list[int], number: int):
+    print(f"{'board':>7} {'arithmetic':>12} {'peer table':>12} {'saving':>8}")
+    for n in sizes:
+        arithmetic, table = benchmark(n, number)
+        board = f"{n * n}x{n * n}"
+        print(
+            f"{board:>7} {arithmetic * 1e9:>9.0f} ns {table * 1e9:>9.0f} ns "
+            f"{1 - table / arithmetic:>7.0%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark a peer sweep with and without the peer table."
+    )
+    _ = parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[3, 4, 5],
+        help="Subgrid sizes to benchmark (default is 3 4 5)",
+    )
+    _ = parser.add_argument(
+        "--number", type=int, default=200, help="Sweeps of the whole board per size"
+    )
+    args = parser.parse_args()
+
+    main(sizes=args.sizes, number=args.number)
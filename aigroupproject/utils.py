@@ -1,13 +1,272 @@
+import functools
+import json
+import math
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
 class RT:
-    """Class used to measure runtime performance of functions."""
+    """Class used to measure runtime performance of functions.
+
+    Hot-path functions are marked with @RT.hot_path, which only registers them and
+    hands the function back untouched, so they cost nothing while profiling is off.
+    RT.enable() swaps every registered function for a timing wrapper in its module or
+    class, and RT.disable() puts the originals back.
 
-    function_runtimes: dict[str, float] = {}
+    Stats are kept per function name as [calls, total, min, max] seconds. A recursive
+    function is only timed by its outermost call, so its total is the time spent in
+    the whole search and its call count is the number of search nodes.
+    """
+
+    # name -> [calls, total seconds, min seconds, max seconds]
+    function_runtimes: dict[str, list[float]] = {}
+    enabled: bool = False
+    _hot_paths: list[Callable[..., Any]] = []
+    _originals: list[tuple[object, str, Callable[..., Any]]] = []
+    _depth: dict[str, int] = {}
 
     @classmethod
-    def update_runtime(cls, function_name: str, start_time: float, end_time: float):
-        # Update the runtime in the dictionary for the given function
+    def update_runtime(
+        cls, function_name: str, start_time: float, end_time: float, calls: int = 1
+    ):
         elapsed_time = end_time - start_time
-        if function_name not in cls.function_runtimes:
-            # print(cls.function_runtimes)
-            cls.function_runtimes[function_name] = 0
-        cls.function_runtimes[function_name] += elapsed_time
+        stat = cls.function_runtimes.setdefault(function_name, [0, 0.0, math.inf, 0.0])
+        stat[0] += calls
+        stat[1] += elapsed_time
+        stat[2] = min(stat[2], elapsed_time)
+        stat[3] = max(stat[3], elapsed_time)
+
+    @classmethod
+    def hot_path(cls, func: F) -> F:
+        """Decorator registering a function (or method) for RT.enable to time."""
+        cls._hot_paths.append(func)
+        return func
+
+    @classmethod
+    def _timed(cls, func: Callable[..., Any], name: str) -> Callable[..., Any]:
+        depth = cls._depth
+        stats = cls.function_runtimes
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if depth.get(name):
+                # A recursive call. Only count it, the outermost call does the timing.
+                depth[name] += 1
+                stats.setdefault(name, [0, 0.0, math.inf, 0.0])[0] += 1
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    depth[name] -= 1
+            depth[name] = 1
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                depth[name] = 0
+                cls.update_runtime(name, start_time, time.perf_counter())
+
+        return wrapper
+
+    @classmethod
+    def enable(cls):
+        """Start timing every function registered with @RT.hot_path."""
+        if cls.enabled:
+            return
+        for func in cls._hot_paths:
+            # Find the module or class the function is stored in by its qualified name
+            owner: object = sys.modules[func.__module__]
+            *path, attr = func.__qualname__.split(".")
+            for part in path:
+                owner = getattr(owner, part)
+            name = f"{func.__module__}.{func.__qualname__}"
+            cls._originals.append((owner, attr, func))
+            setattr(owner, attr, cls._timed(func, name))
+        cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        """Put the untimed functions back."""
+        for owner, attr, func in reversed(cls._originals):
+            setattr(owner, attr, func)
+        cls._originals.clear()
+        cls._depth.clear()
+        cls.enabled = False
+
+    @classmethod
+    @contextmanager
+    def profiling(cls) -> Iterator[None]:
+        """Time the registered functions inside a with block."""
+        already_enabled = cls.enabled
+        cls.enable()
+        try:
+            yield
+        finally:
+            if not already_enabled:
+                cls.disable()
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name: str) -> Iterator[None]:
+        """Time a block of code under the given name. Does nothing while disabled."""
+        if not cls.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.update_runtime(name, start_time, time.perf_counter())
+
+    @classmethod
+    def reset(cls):
+        cls.function_runtimes.clear()
+
+    @classmethod
+    def snapshot(cls) -> dict[str, dict[str, float]]:
+        """The stats as plain dicts, to send between processes or dump as JSON."""
+        return {
+            name: {"calls": calls, "total": total, "min": low, "max": high}
+            for name, (calls, total, low, high) in cls.function_runtimes.items()
+        }
+
+    @classmethod
+    def merge(cls, snapshot: dict[str, dict[str, float]]):
+        """Add a snapshot, e.g. from a worker process, to these stats."""
+        for name, stat in snapshot.items():
+            mine = cls.function_runtimes.setdefault(name, [0, 0.0, math.inf, 0.0])
+            mine[0] += stat["calls"]
+            mine[1] += stat["total"]
+            mine[2] = min(mine[2], stat["min"])
+            mine[3] = max(mine[3], stat["max"])
+
+    @classmethod
+    def to_json(cls) -> str:
+        snapshot = cls.snapshot()
+        for stat in snapshot.values():
+            if stat["min"] == math.inf:  # Never timed, only counted
+                stat["min"] = 0.0
+        return json.dumps(snapshot, indent=2)
+
+    @classmethod
+    def format_table(cls) -> str:
+        rows = sorted(cls.function_runtimes.items(), key=lambda item: -item[1][1])
+        width = max((len(name) for name, _ in rows), default=8)
+        lines = [
+            f"{'function':<{width}} {'calls':>10} {'total s':>10} {'mean us':>10} "
+            f"{'min us':>10} {'max us':>10}"
+        ]
+        for name, (calls, total, low, high) in rows:
+            low = 0.0 if low == math.inf else low
+            mean = total / calls if calls else 0.0
+            lines.append(
+                f"{name:<{width}} {calls:>10.0f} {total:>10.4f} {mean * 1e6:>10.1f} "
+                f"{low * 1e6:>10.1f} {high * 1e6:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+class Trace:
+    """Buffered record of a search, for following a solver without printing from its
+    hot loop.
+
+    Solvers append an event for every value they place and every value they take back.
+    Nothing is written until dump(), and a solver only records events when it was given
+    a Trace, so solving without one costs a single None check per assignment.
+    """
+
+    ASSIGN = "assign"  # A value tried by the search
+    PROPAGATE = "propagate"  # A value forced by propagation
+    BACKTRACK = "backtrack"  # A tried value taken back, with everything placed after it
+
+    grid: list[list[int]]  # The board the search started from
+    events: list[tuple[str, int, int, int, int]]  # (kind, depth, row, col, value)
+
+    def __init__(self, grid: list[list[int]]) -> None:
+        self.grid = [row[:] for row in grid]
+        self.events = []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def assign(self, depth: int, row: int, col: int, val: int):
+        self.events.append((Trace.ASSIGN, depth, row, col, val))
+
+    def propagate(self, depth: int, row: int, col: int, val: int):
+        self.events.append((Trace.PROPAGATE, depth, row, col, val))
+
+    def backtrack(self, depth: int, row: int, col: int, val: int):
+        self.events.append((Trace.BACKTRACK, depth, row, col, val))
+
+    def dump(self, path: str):
+        """Write the starting board on the first line, then one event per line."""
+        with open(path, "w") as f:
+            _ = f.write(" ".join(str(v) for row in self.grid for v in row) + "\n")
+            for kind, depth, row, col, val in self.events:
+                _ = f.write(f"{kind} {depth} {row} {col} {val}\n")
+
+    @classmethod
+    def load(cls, path: str) -> "Trace":
+        with open(path) as f:
+            cells = [int(v) for v in f.readline().split()]
+            size = math.isqrt(len(cells))
+            trace = cls([cells[r * size : r * size + size] for r in range(size)])
+            for line in f:
+                kind, *numbers = line.split()
+                depth, row, col, val = map(int, numbers)
+                trace.events.append((kind, depth, row, col, val))
+        return trace
+
+    def replay(self) -> Iterator[tuple[tuple[str, int, int, int, int], list[list[int]]]]:
+        """Every event with the board as it was right after it. The same board list is
+        yielded each time, so copy it to keep it."""
+        board = [row[:] for row in self.grid]
+        placed: list[tuple[int, int]] = []
+        for event in self.events:
+            kind, _, row, col, val = event
+            if kind == Trace.BACKTRACK:
+                # Clear everything placed since the value was tried, the value included
+                while placed:
+                    r, c = placed.pop()
+                    board[r][c] = 0
+                    if (r, c) == (row, col):
+                        break
+            else:
+                board[row][col] = val
+                placed.append((row, col))
+            yield event, board
+
+
+@dataclass
+class SolveResult:
+    """What a solver returns: the solution, if any, and how much searching it took.
+    Truthy when a solution was found."""
+
+    solution: list[list[int]] | None = None
+    nodes: int = 0  # Search nodes expanded, the root included
+    backtracks: int = 0  # Values tried and then undone
+    max_depth: int = 0
+    propagations: int = 0  # Propagation passes run
+    elapsed: float = 0.0  # Seconds, from time.perf_counter
+    trace: Trace | None = None  # Set to record the search
+
+    def __bool__(self) -> bool:
+        return self.solution is not None
+
+    def enter(self, depth: int):
+        """Count a search node at the given depth."""
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def format_stats(self) -> str:
+        return (
+            f"{self.nodes} nodes, {self.backtracks} backtracks, max depth "
+            f"{self.max_depth}, {self.propagations} propagations, "
+            f"{self.elapsed:.6f} seconds"
+        )